@@ -0,0 +1,71 @@
+"""
+Measures how long caret motion takes as the document grows.
+Run with python bench/motion.py [--max-lines N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'dim'))
+
+from buffer import Buffer
+from position import Position
+from registers import Registers
+from selection import SelectMode
+from state import StateManager
+
+LINE = 'The quick brown fox jumps over the lazy dog.'
+KEYS = ['KEY_LEFT', 'KEY_RIGHT', 'KEY_UP', 'KEY_DOWN']
+REPEAT = 2000
+
+def make_buffer(lines):
+    buffer = Buffer()
+    buffer.load_text('\n'.join([LINE] * lines))
+    return buffer
+
+def time_motion(buffer, key):
+    """Returns the average time in microseconds of moving the caret back and forth in the middle of the text"""
+    caret = Position(buffer.get_text_height() // 2, len(LINE) // 2)
+    move = {
+        'KEY_LEFT': caret.move_left,
+        'KEY_RIGHT': caret.move_right,
+        'KEY_UP': caret.move_up,
+        'KEY_DOWN': caret.move_down
+    }[key]
+    back = {
+        'KEY_LEFT': caret.move_right,
+        'KEY_RIGHT': caret.move_left,
+        'KEY_UP': caret.move_down,
+        'KEY_DOWN': caret.move_up
+    }[key]
+    start = time.perf_counter()
+    for _ in range(REPEAT // 2):
+        move(buffer)
+        back(buffer)
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+def time_selection(buffer):
+    """Returns the average time in microseconds of a selection step in Select mode"""
+    args = type('config', (), {'debug': False, 'read_only': True, 'file': None})
+    caret = Position(buffer.get_text_height() // 2, len(LINE) // 2)
+    mode = SelectMode(buffer, StateManager(), caret, 'None', args, Registers())
+    start = time.perf_counter()
+    for _ in range(REPEAT // 2):
+        mode.parse_key('KEY_DOWN')
+        mode.parse_key('KEY_RIGHT')
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-lines', type = int, default = 10 ** 7, help = 'largest document to measure')
+    args = parser.parse_args()
+    sizes = [10 ** i for i in range(1, 8) if 10 ** i <= args.max_lines]
+    print(f'{"lines":>10}' + ''.join([f'{key:>12}' for key in KEYS]) + f'{"SELECT":>12}   (us per key)')
+    for lines in sizes:
+        buffer = make_buffer(lines)
+        times = [time_motion(buffer, key) for key in KEYS] + [time_selection(buffer)]
+        print(f'{lines:>10}' + ''.join([f'{t:>12.2f}' for t in times]))
+
+if __name__ == '__main__':
+    main()
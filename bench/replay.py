@@ -0,0 +1,136 @@
+"""
+Replays scripted keystrokes against the editor on a headless screen, and reports how long
+each key takes to handle and draw, along with the peak memory used by each operation.
+Documents are the files in dim/debug and generated files of different sizes.
+Run with python bench/replay.py [--lines 10000 1000000] [--no-memory]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DIM_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'dim')
+sys.path.insert(0, DIM_DIR)
+
+from command import CommandMode
+from editor import Editor
+from headless import HeadlessScreen
+from keys import PASTE_END, PASTE_START
+
+SCREEN_SIZE = (40, 120)
+PARAGRAPH = (
+    'The quick brown fox jumps over the lazy dog. Pack my box with five dozen liquor jugs.\n'
+    'How vexingly quick daft zebras jump! Sphinx of black quartz, judge my vow.\n'
+)
+
+def command(text):
+    """Returns the keys that type a command and run it"""
+    return list(text) + ['\n']
+
+def goto_middle(editor):
+    return command(f'g[{editor.buffer.get_text_height() // 2}]')
+
+def get_operations(editor):
+    """Returns (name, setup keys, measured keys) for each operation, which are replayed in order"""
+    return [
+        ('typing', goto_middle(editor) + command('i'), list(PARAGRAPH * 4) + ['\x1b']),
+        ('pasting', goto_middle(editor) + command('i'), [PASTE_START + PARAGRAPH * 50 + PASTE_END] * 20 + ['\x1b']),
+        ('select delete', goto_middle(editor), (command('v') + ['KEY_DOWN'] * 5 + ['KEY_RIGHT'] * 10 + command('x')) * 20),
+        ('undo', [], command('z') * 100),
+        ('redo', [], command('y') * 100),
+        ('bulk delete', goto_middle(editor), command('v') + list('100000') + ['KEY_DOWN'] + command('x')),
+        ('yank put', command('g[1]'), command('v') + list('100000') + ['KEY_DOWN'] + command('c') + command('p')),
+        ('macro replay', command('q[a]') + command('i') + list('hello ') + ['\n', '\x1b'] + command('q'), command('1000@[a]')),
+        ('scrolling', command('g[1]'), ['KEY_DOWN'] * 300 + ['KEY_UP'] * 300 + ['KEY_NPAGE', 'KEY_PPAGE'] * 10)
+    ]
+
+def split_keys(keys):
+    """Splits pastes into the characters a terminal sends, which the editor reads one at a time"""
+    return [char for key in keys for char in (key if key.startswith(PASTE_START) else [key])]
+
+def make_args(path):
+    # the file is opened read only so that no swap file is left next to it
+    return type('config', (), {
+        'file': path, 'debug': False, 'read_only': True, 'batch_keys': 1, 'batch_time': 0, 'wrap': False, 'follow': False
+    })
+
+def open_editor(path):
+    screen = HeadlessScreen(*SCREEN_SIZE)
+    # the screen also stands in for the terminal, so nothing is written to the real one
+    editor = Editor(screen, make_args(path), terminal = screen)
+    editor.mode = CommandMode(
+        editor.buffer, editor.state_manager, editor.caret, editor.file_name, editor.args, editor.registers
+    )
+    editor.display()
+    return (editor, screen)
+
+def replay(editor, screen, keys):
+    """Handles and draws each key in turn. Returns the time taken by each, in milliseconds"""
+    screen.send(split_keys(keys))
+    times = []
+    while screen.keys:
+        start = time.perf_counter()
+        editor.handle_key(editor.get_key())
+        editor.display()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def run(path, memory):
+    """Returns (operation, latencies, peak memory in bytes or None) for each operation on a document"""
+    results = []
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    editor, screen = open_editor(path)
+    opened = (time.perf_counter() - start) * 1000
+    results.append(('open', [opened], tracemalloc.get_traced_memory()[1] if memory else None))
+    for name, setup, keys in get_operations(editor):
+        replay(editor, screen, setup)
+        if memory:
+            # only count memory allocated during the operation
+            tracemalloc.stop()
+            tracemalloc.start()
+        times = replay(editor, screen, keys)
+        results.append((name, times, tracemalloc.get_traced_memory()[1] if memory else None))
+    if memory:
+        tracemalloc.stop()
+    return results
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def make_document(directory, lines):
+    """Writes a Python file with some number of lines, so that it is highlighted like source code"""
+    path = os.path.join(directory, f'generated_{lines}.py')
+    with open(path, 'w') as document:
+        for y in range(lines):
+            document.write(f'    value_{y} = compute("item", {y}) + 0x{y:x}  # line {y}\n')
+    return path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type = int, nargs = '*', default = [10 ** 4, 10 ** 6], help = 'sizes of the generated documents')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'skip the second run that measures memory')
+    args = parser.parse_args()
+    debug_dir = os.path.join(DIM_DIR, 'debug')
+    with tempfile.TemporaryDirectory() as directory:
+        documents = [os.path.join(debug_dir, name) for name in sorted(os.listdir(debug_dir))]
+        documents += [make_document(directory, lines) for lines in args.lines]
+        print(f'{"document":<24}{"operation":<16}{"keys":>6}{"p50":>9}{"p90":>9}{"p99":>9}{"max":>9}{"peak MB":>10}   (ms per key)')
+        for path in documents:
+            latencies = run(path, False)
+            # tracing allocations slows everything down, so memory is measured in a separate run
+            peaks = [peak for _, _, peak in run(path, True)] if not args.no_memory else [None] * len(latencies)
+            for (name, times, _), peak in zip(latencies, peaks):
+                print(
+                    f'{os.path.basename(path)[ : 23]:<24}{name:<16}{len(times):>6}'
+                    + ''.join([f'{percentile(times, fraction):>9.2f}' for fraction in (0.5, 0.9, 0.99)])
+                    + f'{max(times):>9.2f}'
+                    + (f'{peak / (1024 * 1024):>10.2f}' if peak is not None else f'{"-":>10}')
+                )
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,12 @@
 import argparse
-import hashlib
 import os
 import sys
 
 class Argparser:
-    SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
-    TUTORIAL_DIR = os.path.join(SCRIPT_DIR, 'tutorial')
-    TUTORIAL_LEN = len(os.listdir(TUTORIAL_DIR)) if os.path.exists(TUTORIAL_DIR) else 0
+    @staticmethod
+    def get_tutorial_dir():
+        # the folder is only looked up when a tutorial is opened
+        return os.path.join(os.path.dirname(os.path.realpath(__file__)), 'tutorial')
 
     @staticmethod
     def parse_args():
@@ -25,15 +25,69 @@ class Argparser:
         parser.add_argument(
             '-t', '--tutorial',
             help = 'displays tutorial file at provided index',
-            type = int,
-            choices = range(1, Argparser.TUTORIAL_LEN + 1)
+            type = int
         )
         parser.add_argument(
             '--read-only',
             help = 'indicate that the file cannot be written to',
             action = 'store_true'
         )
-        return parser.parse_args()
+        parser.add_argument(
+            '--batch-keys',
+            help = 'maximum number of typed keys handled before the screen is redrawn',
+            type = int,
+            default = 256
+        )
+        parser.add_argument(
+            '--batch-time',
+            help = 'maximum number of milliseconds spent handling typed keys before the screen is redrawn',
+            type = int,
+            default = 50
+        )
+        parser.add_argument(
+            '--profile',
+            help = 'write a cProfile dump of the session to PATH when the editor exits, which slows the editor down',
+            metavar = 'PATH'
+        )
+        parser.add_argument(
+            '--profile-stacks',
+            help = 'sample the stack during the session and write collapsed stacks for a flame graph to PATH',
+            metavar = 'PATH'
+        )
+        parser.add_argument(
+            '--wrap',
+            help = 'wrap lines that are longer than the screen is wide',
+            action = 'store_true'
+        )
+        parser.add_argument(
+            '--follow',
+            help = 'open the file read only and show lines as they are added to it, like tail -f',
+            action = 'store_true'
+        )
+        parser.add_argument(
+            '--follow-lines',
+            help = 'maximum number of lines of a followed file that are kept, dropping the oldest first',
+            type = int,
+            default = 100000,
+            metavar = 'LINES'
+        )
+        parser.add_argument(
+            '--startup-time',
+            help = 'print how long each phase of starting the editor took when it exits',
+            action = 'store_true'
+        )
+        args = parser.parse_args()
+        if args.tutorial is not None:
+            tutorial_dir = Argparser.get_tutorial_dir()
+            count = len(os.listdir(tutorial_dir)) if os.path.exists(tutorial_dir) else 0
+            if not 1 <= args.tutorial <= count:
+                parser.error(f'argument -t/--tutorial: invalid choice: {args.tutorial} (choose from 1 to {count})')
+        # at least one key is handled before each redraw, or keys would never be handled
+        if args.batch_keys < 1:
+            parser.error(f'argument --batch-keys: must be at least 1, not {args.batch_keys}')
+        if args.batch_time < 0:
+            parser.error(f'argument --batch-time: must not be negative, not {args.batch_time}')
+        return args
 
     @staticmethod
     def get_args():
@@ -45,13 +99,23 @@ class Argparser:
             res.tutorial = None
         else:
             res.debug = True if (hasattr(args, 'debug') and args.debug) else None
+            import hashlib
+            tutorial_dir = Argparser.get_tutorial_dir()
             file_hash = hashlib.md5(str(args.tutorial).encode()).hexdigest()
-            file_path = os.path.join(Argparser.TUTORIAL_DIR, file_hash)
-            if not (os.path.isdir(Argparser.TUTORIAL_DIR or os.path.isfile(file_path))):
+            file_path = os.path.join(tutorial_dir, file_hash)
+            if not (os.path.isdir(tutorial_dir or os.path.isfile(file_path))):
                 print('The tutorial directory or file was not found!\n')
                 sys.exit(1)
             res.file = file_path
             res.read_only = True
+        for attr in ['batch_keys', 'batch_time', 'wrap', 'profile', 'profile_stacks', 'startup_time', 'follow', 'follow_lines']:
+            setattr(res, attr, getattr(args, attr))
+        if res.follow:
+            if res.file is None:
+                print('A file must be given to follow!\n')
+                sys.exit(1)
+            # text added to the file would move the edits made to it
+            res.read_only = True
         if res.file is not None and not os.path.isfile(res.file):
             print('The file doesn\'t exist!\n')
             sys.exit(1)
@@ -1,6 +1,9 @@
 import os
 import sys
 
+from latency import measure
+from position import Position
+
 MAX_COMMAND_LENGTH = 20
 
 # mode constants
@@ -9,22 +12,62 @@ MODE_INSERT = 'INSERT'
 MODE_SELECT = 'SELECT'
 
 class Mode:
-    def __init__(self, buffer, state_manager, caret, file_name, args):
+    def __init__(self, buffer, state_manager, caret, file_name, args, registers):
         self.buffer = buffer
         self.state_manager = state_manager
         self.caret = caret
         self.file_name = file_name
         self.args = args
+        self.registers = registers
         # set up
-        self.script_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
         self.debug_mode = args.debug
 
     def get_properties(self):
-        return (self.buffer, self.state_manager, self.caret, self.file_name, self.args)
+        return (self.buffer, self.state_manager, self.caret, self.file_name, self.args, self.registers)
 
     def push_state(self):
-        if self.args.allow_state:
-            self.state_manager.push_state(self.caret, self.buffer.get_content())
+        with measure(self.buffer.latency, 'push_state'):
+            self.state_manager.push_state(self.caret, self.buffer.take_changes())
+
+    def finish_save(self, wait = False):
+        """Checks whether a save running in the background has finished, optionally waiting for it"""
+        saver = self.buffer.poll_saver(wait)
+        if saver is not None and saver.error is not None:
+            self.state_manager.saved = False
+
+    def take_count(self):
+        """Returns the number typed before a motion, which is repeated that many times, and clears it"""
+        if self.cur_command.isdecimal():
+            count, self.cur_command = (int(self.cur_command), '')
+            return max(1, count)
+        return 1
+
+    def parse_repeated(self, command):
+        """
+        Parses a command that may start with a number of times to repeat it, such as 3x.
+        The repeated commands are one edit, which is undone in one step.
+        """
+        digits = len(command) - len(command.lstrip('0123456789'))
+        count = max(1, int(command[ : digits])) if digits else 1
+        command, args = self.parse_args(command[digits : ])
+        if command == '@':
+            # replay the macro count times rather than queueing it count times
+            return self.replay_macro(args, count)
+        self.state_manager.start_batch()
+        try:
+            for _ in range(count):
+                res = self.parse_command(command, args)
+                if res != self.name:
+                    break
+        finally:
+            self.state_manager.end_batch(self.caret)
+        return res
+
+    def replay_macro(self, args, count = 1):
+        error = self.registers.replay(args[0] if args else None, count)
+        if error is not None:
+            self.buffer.status = error
+        return self.name
 
     def parse_args(self, command):
         """
@@ -81,8 +124,7 @@ class Mode:
                 if self.args.file is not None:
                     if not os.path.isfile(self.args.file): 
                         raise FileNotFoundError
-                    with open(self.args.file, 'w') as edit_file:
-                        edit_file.write(self.buffer.get_content())
+                    self.buffer.save_file(self.args.file)
             except (FileNotFoundError, PermissionError, OSError):
                 print('The current file can no longer be found.\n')
                 sys.exit(1)
@@ -90,22 +132,60 @@ class Mode:
                 print('The encoding of the file is not supported.\n')
                 sys.exit(1)
             self.state_manager.saved = True
+            self.finish_save()
+            if (saver := self.buffer.saver) is not None:
+                # the result is shown as soon as the save is done rather than at the next key
+                self.buffer.tasks.run('save', lambda job: saver.wait(), done = lambda _: self.finish_save())
         elif command == 'v':
             return MODE_SELECT
+        elif command == 'g':
+            # go to g[line], g[line][column] or g[#offset]
+            try:
+                if args[0].startswith('#'):
+                    self.caret = self.buffer.get_position(int(args[0][1 : ]))
+                else:
+                    y = int(args[0]) - 1
+                    if y >= self.buffer.get_text_height():
+                        # the line may not have been loaded yet
+                        self.buffer.poll_loader(wait = True)
+                    y = max(0, min(y, self.buffer.get_text_height() - 1))
+                    x = int(args[1]) - 1 if len(args) > 1 else 0
+                    self.caret = Position(y, max(0, min(x, self.buffer.get_line_length(y))))
+            except (IndexError, ValueError):
+                pass
+        elif command == 'm':
+            # m[name] marks the caret, which j[name] goes back to
+            if args:
+                self.buffer.set_mark(args[0], self.caret)
+        elif command == 'j':
+            pos = self.buffer.get_mark(args[0]) if args else None
+            if pos is not None:
+                self.caret = pos
+            else:
+                self.buffer.status = f'No mark is set at {args[0]}' if args else 'No mark was given'
+        elif command == 'q':
+            # q[name] starts recording a macro, and q stops
+            if self.registers.recording is not None:
+                self.registers.stop_recording()
+            elif args:
+                self.registers.start_recording(args[0])
+        elif command == '@':
+            # @[name] replays a macro, and @ replays the last one
+            return self.replay_macro(args)
+        elif command == 'w':
+            # wrap long lines, or stop wrapping them
+            self.buffer.set_wrap(self.buffer.wrap is None)
         elif command == 'z':
-            if not self.args.allow_state:
-                return MODE_COMMAND
-            caret, text = self.state_manager.undo()
-            self.caret = caret.copy()
-            self.buffer.load_text(text)
+            caret, changes = self.state_manager.undo()
+            if caret is not None and changes is not None:
+                self.caret = caret.copy()
+                self.buffer.apply_changes(changes)
             return MODE_COMMAND
         elif command == 'y':
-            if not self.args.allow_state:
-                return MODE_COMMAND
-            caret, text = self.state_manager.redo()
-            if caret is not None and text is not None:
+            caret, changes = self.state_manager.redo()
+            if caret is not None and changes is not None:
                 self.caret = caret.copy()
-                self.buffer.load_text(text)
+                self.buffer.apply_changes(changes)
                 return MODE_COMMAND
         else:
             return None
@@ -1,7 +1,22 @@
+import atexit
+import os
 from curses import *
 
 from keys import *
+from latency import measure
 from position import *
+from render import *
+from loader import FileLoader
+from marks import MarkIndex
+from rope import PieceTable, leaf, merge
+from save import Saver, can_replace
+from search import Search
+from syntax import Highlighter
+from swap import SwapFile
+from tasks import Tasks
+from terminal import Terminal
+from width import LayoutCache
+from wrap import WrapMap
 
 COLORS = [
     (1, 7, 233),
@@ -10,32 +25,357 @@ COLORS = [
     (4, 200, 237),
     (5, 35, 237),
     (6, 150, 237),
-    (7, 233, 7)
+    (7, 233, 7),
+    (8, 233, 221),
+    (9, 200, 233),
+    (10, 35, 233),
+    (11, 245, 233),
+    (12, 221, 233)
 ]
 
-PADCHAR = ' '
-PAD_LEN = len(PADCHAR)
-HEADER_LEN = 2
+# the parts of the header that are narrowed when it is too wide, in order, with the fewest characters each keeps
+HEADER_SHRINK_ORDER = [
+    ('left', 3, 1),
+    ('right', 1, 1),
+    ('left', 1, 1),
+    ('left', 5, 1),
+    ('left', 2, 0),
+    ('left', 6, 0),
+]
+
+class Lines:
+    """
+    A read-only, list-like view of the lines of a piece table.
+    Lines are only built when they are accessed, so making a view copies nothing.
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.line_count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if start >= stop:
+                return []
+            return self.table.text(self.table.line_start(start), self.table.line_end(stop - 1)).split('\n')
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('line index out of range')
+        return self.table.text(self.table.line_start(index), self.table.line_end(index))
+
+    def __iter__(self):
+        return iter(self.table.text().split('\n'))
+
+class BufferLines(Lines):
+    """A view of the current lines of a buffer which can also add and remove lines"""
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    @property
+    def table(self):
+        return self.buffer.table
+
+    def insert(self, y, text):
+        self.buffer.insert_line(y, text)
+
+    def pop(self, y = -1):
+        text = self[y]
+        self.buffer.pop_line(y if y >= 0 else y + len(self))
+        return text
 
 class Buffer:
-    def __init__(self, stdscr):
+    def __init__(self, stdscr = None, terminal = None):
+        """
+        Creates a buffer drawn to stdscr, or an off-screen buffer if stdscr is None.
+        terminal makes the curses calls outside of a window, which is the real terminal if not given.
+        """
         # set initial values
         self.stdscr = stdscr
-        self.lines = ['']
-        self.height, self.width = stdscr.getmaxyx()
+        self.terminal = terminal if terminal is not None else Terminal()
+        self.table = PieceTable()
+        self.changes = [] # (offset, removed, inserted) since the last call to take_changes
+        self.loader = None
+        self.mapped = False # whether pieces of the text are read from a mapped file
+        self.encoding = None # Encoding of the file, or None for the default encoding
+        self.saver = None
+        self.tasks = Tasks() # jobs that modes run in the background
+        self.swap = None
+        self.search = None
+        self.highlighter = None
+        self.marks = MarkIndex() # named offsets that move with the text
+        self.layouts = LayoutCache(self) # the columns that the characters of each line are drawn in
+        self.wrap = None # maps lines to screen rows when long lines are wrapped
+        self.edits_since_save = None # edits made while a save is running, which the saved file lacks
+        self.status = '' # message shown in the header
+        self.latency = None # times the stages of handling keys in debug mode
+        self.height, self.width = (0, 0)
+        self.renderer = Renderer(stdscr, self.terminal)
+        if stdscr is None:
+            return
+        self.update_screen_size()
         # load colors
-        start_color()
-        use_default_colors()
+        self.terminal.start_color()
+        self.terminal.use_default_colors()
         for color in COLORS:
-            init_pair(*color)
+            self.terminal.init_pair(*color)
         # set background
-        stdscr.bkgd(' ', color_pair(1) | A_BOLD)
+        stdscr.bkgd(' ', self.terminal.color_pair(1) | A_BOLD)
+        # have the terminal mark pasted text so that it arrives as one key
+        self.terminal.write(BRACKETED_PASTE_ON)
+        atexit.register(self.terminal.write, BRACKETED_PASTE_OFF)
+
+    @property
+    def lines(self):
+        return BufferLines(self)
 
     def load_text(self, text):
-        self.lines = text.split('\n')
+        self.table = PieceTable.from_text(text)
+        self.changes = []
+        self.loader = None
+        self.mapped = False
+        self.search = None
+        self.marks.reset()
+        if self.highlighter is not None:
+            self.highlighter.reset()
+        self.layouts.reset()
+        if self.wrap is not None:
+            self.wrap.rows = {}
+        self.renderer.invalidate()
+
+    def load_file(self, path, encoding = None):
+        """
+        Memory maps a file instead of reading it.
+        Lines are added to the buffer as the file is scanned in the background.
+        """
+        self.table = PieceTable()
+        self.changes = []
+        self.loader = FileLoader(path, encoding)
+        self.mapped = True
+        self.search = None
+        self.marks.reset()
+        if self.highlighter is not None:
+            self.highlighter.reset()
+        self.layouts.reset()
+        if self.wrap is not None:
+            self.wrap.rows = {}
+        self.encoding = self.loader.encoding
+        self.renderer.invalidate()
+        self.poll_loader()
+
+    def poll_loader(self, wait = False):
+        """Adds the chunks scanned since the last call to the end of the text"""
+        if self.loader is None:
+            return
+        if wait:
+            self.loader.wait()
+        chunks = self.loader.take()
+        if chunks:
+            self.renderer.mark_lines_from(self.get_text_height() - 1)
+            self.layouts.edited(self.get_text_height() - 1, True)
+            if self.wrap is not None:
+                self.wrap.edited(self.get_text_height() - 1, True)
+            root = self.table.root
+            for chunk in chunks:
+                root = merge(root, leaf(chunk, 0, chunk.chars, chunk.lines))
+            self.table = PieceTable(root)
+            if self.search is not None:
+                self.search.update(self.table)
+        if self.loader.error is not None:
+            raise self.loader.error
+        if self.loader.is_done():
+            self.loader = None
+
+    def append_text(self, text):
+        """
+        Adds text to the end without recording an edit, such as the lines written to a followed file.
+        It is not undone, and it is not written to the swap file.
+        """
+        if not text:
+            return
+        offset = len(self.table)
+        y = self.get_text_height() - 1
+        self.table = self.table.insert(offset, text)
+        if self.search is not None:
+            self.search.edited(self.table, offset, 0, len(text))
+        self.marks.edited(offset, 0, len(text))
+        if self.highlighter is not None:
+            self.highlighter.edited(y, 0, text.count('\n'))
+        self.layouts.edited(y, True)
+        if self.wrap is not None:
+            self.wrap.edited(y, True)
+        self.renderer.mark_lines_from(y)
+
+    def drop_lines(self, count):
+        """Removes the first count lines without recording an edit, which keeps a followed file within a number of lines"""
+        end = self.line_start(count)
+        self.table = self.table.delete(0, end)
+        if self.search is not None:
+            self.search.edited(self.table, 0, end, 0)
+        self.marks.edited(0, end, 0)
+        if self.highlighter is not None:
+            self.highlighter.edited(0, count, 0)
+        self.layouts.edited(0, True)
+        if self.wrap is not None:
+            self.wrap.edited(0, True)
+        self.renderer.mark_lines_from(0)
+
+    def save_file(self, path):
+        """Starts saving the text to path. The save continues in the background if it takes a while"""
+        if self.saver is not None:
+            self.saver.wait()
+        self.poll_loader(wait = True)
+        if self.mapped and (os.name == 'nt' or not can_replace(path)):
+            # a mapped file cannot be replaced on Windows, or overwritten in place while it is mapped
+            self.load_text(self.table.text())
+        self.edits_since_save = []
+        self.saver = Saver(self.table, path, self.encoding)
+        self.status = self.saver.get_status()
+
+    def poll_saver(self, wait = False):
+        """Updates the status of the current save. Returns the saver once it is done"""
+        if self.saver is None:
+            return None
+        if wait:
+            self.saver.wait()
+        self.status = self.saver.get_status()
+        if not self.saver.is_done():
+            return None
+        saver, self.saver = self.saver, None
+        if saver.error is None:
+            # the swap file only needs the edits that the saved file is missing
+            self.start_swap(saver.path, self.edits_since_save)
+        self.edits_since_save = None
+        return saver
+
+    def start_swap(self, path, records = (), resume_at = None):
+        """Starts autosaving the edits of the file at path to its swap file"""
+        if self.swap is not None:
+            self.swap.restart(path, records)
+            return
+        try:
+            self.swap = SwapFile(path, records, resume_at)
+        except OSError:
+            # the directory may not be writable, editing works without a swap file
+            self.swap = None
+
+    def close_swap(self):
+        if self.swap is not None:
+            self.swap.close()
+            self.swap = None
+
+    def replace(self, start, end, text):
+        """
+        Replaces the characters from offset start to end [inclusive, exclusive) with text.
+        Every edit of the buffer goes through here and is recorded as a change.
+        """
+        removed = self.table.text(start, end) if end > start else ''
+        if not (removed or text):
+            return
+        self.table = self.table.delete(start, end).insert(start, text)
+        self.changes.append((start, removed, text))
+        self.edited(start, removed, text)
+
+    def take_changes(self):
+        """Returns the changes made since the last call and starts a new list"""
+        changes, self.changes = self.changes, []
+        return changes
+
+    def apply_changes(self, changes):
+        """Applies a list of changes (such as ones from the undo journal) without recording them"""
+        for offset, removed, inserted in changes:
+            self.table = self.table.delete(offset, offset + len(removed)).insert(offset, inserted)
+            self.edited(offset, removed, inserted)
+
+    def edited(self, offset, removed, inserted):
+        """Updates everything that depends on the text after the text at offset changed"""
+        self.status = ''
+        if self.swap is not None:
+            self.swap.record(offset, len(removed), inserted)
+        if self.edits_since_save is not None:
+            self.edits_since_save.append((offset, len(removed), inserted))
+        if self.search is not None:
+            self.search.edited(self.table, offset, len(removed), len(inserted))
+        self.marks.edited(offset, len(removed), len(inserted))
+        y = self.table.line_of(offset)
+        lines_moved = '\n' in removed or '\n' in inserted
+        if self.highlighter is not None:
+            self.highlighter.edited(y, removed.count('\n'), inserted.count('\n'))
+        self.layouts.edited(y, lines_moved)
+        if self.wrap is not None:
+            # a line that gets longer or shorter can move the rows below it
+            lines_moved = self.wrap.edited(y, lines_moved)
+        if lines_moved:
+            # the lines below have moved
+            self.renderer.mark_lines_from(y)
+        else:
+            self.renderer.mark_line(y)
+
+    def start_search(self, pattern):
+        """Starts highlighting the matches of a regular expression. Raises re.error if it is invalid"""
+        if self.search is None or self.search.pattern != pattern:
+            self.search = Search(pattern, self.table)
+            self.renderer.invalidate()
+
+    def stop_search(self):
+        if self.search is not None:
+            self.search = None
+            self.renderer.invalidate()
+
+    def poll_search(self):
+        """Adds the matches found in the background since the last call"""
+        if self.search is None:
+            return
+        found = self.search.poll()
+        if found is not None:
+            self.renderer.mark_range(self.table.line_of(found[0]), self.table.line_of(found[1]))
+
+    def is_searching(self):
+        return self.search is not None and not self.search.is_done()
+
+    def find_match(self, pos, backwards = False):
+        """
+        Returns the position of the next match after pos, or the previous match before it.
+        Returns None if there is no match. The header shows the number of the match.
+        """
+        match = self.search.find(self.get_offset(pos), backwards)
+        self.status = self.search.get_status(match)
+        return self.get_position(match[0]) if match is not None else None
+
+    def set_lexer(self, lexer):
+        """Highlights the syntax of the text with a lexer, or stops highlighting it if lexer is None"""
+        self.highlighter = Highlighter(lexer) if lexer is not None else None
+        self.renderer.invalidate()
+
+    def update_highlighter(self, end):
+        """Brings the syntax highlighting of the first end lines up to date"""
+        if self.highlighter is None:
+            return
+        changed = self.highlighter.update(self.lines, end)
+        if changed:
+            self.renderer.mark_range(changed[0], changed[-1])
+
+    def get_line_colors(self, y, line):
+        """
+        Returns the (x1, x2, color) [inclusive, exclusive) spans of line y that are colored.
+        Search matches come after syntax colors, so that they are drawn over them.
+        """
+        colors = []
+        if self.highlighter is not None and y < self.highlighter.valid:
+            colors.extend(self.highlighter.get_colors(line, y))
+        if self.search is not None:
+            start = self.line_start(y)
+            for match_start, match_end in self.search.get_matches(start, start + len(line)):
+                colors.append((match_start - start, match_end - start, 8))
+        return colors
 
     def get_content(self):
-        return '\n'.join(self.lines)
+        self.poll_loader(wait = True)
+        return self.table.text()
 
     def get_height(self):
         return self.height
@@ -50,49 +390,120 @@ class Buffer:
         return self.width - PAD_LEN
 
     def get_text_height(self):
-        return len(self.lines)
+        return self.table.line_count()
     
     def get_line_length(self, y):
-        return len(self.lines[y])
+        return self.line_end(y) - self.line_start(y)
 
     def get_max_line_length(self):
         return max([len(i) for i in self.lines])
 
     def update_screen_size(self):
         self.height, self.width = self.stdscr.getmaxyx()
+        if self.wrap is not None:
+            # the last column is kept for the caret, as it is when lines aren't wrapped
+            self.wrap.set_width(self.screen_width() - 1)
+        self.layouts.set_wrap_width(self.wrap.width if self.wrap is not None else None)
+
+    def set_wrap(self, enabled):
+        """Turns wrapping of long lines on or off"""
+        self.wrap = WrapMap(self) if enabled else None
+        if self.stdscr is not None:
+            self.update_screen_size()
+        self.renderer.invalidate()
+
+    def line_start(self, y):
+        if not 0 <= y < self.get_text_height():
+            raise IndexError('line index out of range')
+        return self.table.line_start(y)
+
+    def line_end(self, y):
+        if not 0 <= y < self.get_text_height():
+            raise IndexError('line index out of range')
+        return self.table.line_end(y)
+
+    def get_length(self):
+        return len(self.table)
+
+    def get_offset(self, pos):
+        """Converts a position to the offset of its character from the start of the text"""
+        return self.line_start(pos.y) + min(pos.x, self.get_line_length(pos.y))
+
+    def get_position(self, offset):
+        """Converts an offset from the start of the text to a position"""
+        offset = max(0, min(offset, len(self.table)))
+        y = self.table.line_of(offset)
+        return Position(y, offset - self.table.line_start(y))
+
+    def set_mark(self, name, pos):
+        """Marks a position, which then moves with the text around it"""
+        self.marks.set(name, self.get_offset(pos))
+
+    def get_mark(self, name):
+        """Returns the position of a mark, or None if it is not set"""
+        offset = self.marks.get(name)
+        return self.get_position(offset) if offset is not None else None
+
+    def get_span(self, y, x1, x2):
+        """Converts a slice of line y into a pair of offsets, using the same rules as string slicing"""
+        start = self.line_start(y)
+        x1, x2, _ = slice(x1, x2).indices(self.line_end(y) - start)
+        return (start + x1, start + max(x1, x2))
+
+    def get_range(self, start, end):
+        """Returns the text from offset start to end [inclusive, exclusive) as a table, without copying it"""
+        return self.table.slice(start, end)
 
     def delete_substr(self, y, x1, x2):
         """Deletes some number of characters on one line, from x1 to x2 [inclusive, exclusive)"""
-        self.lines[y] = self.lines[y][ : x1] + self.lines[y][x2 : ]
+        self.replace(*self.get_span(y, x1, x2), '')
 
     def get_substr(self, y, x1, x2):
         """Gets a substring of a line, from x1 to x2 [inclusive, exclusive)"""
-        return self.lines[y][x1 : x2]
+        return self.table.text(*self.get_span(y, x1, x2))
 
     def insert(self, y, x, text):
         """Inserts some text at lines[y][x]"""
-        self.lines[y] = self.lines[y][ : x] + text + self.lines[y][x : ]
+        offset = self.get_span(y, x, None)[0]
+        self.replace(offset, offset, text)
 
     def join(self, y1, y2):
-        self.lines[y1] += self.lines[y2]
-        self.pop_line(y2)
+        if y2 == y1 + 1:
+            # remove the newline between the lines
+            end = self.line_end(y1)
+            self.replace(end, end + 1, '')
+        else:
+            text = self.get_line(y2)
+            self.pop_line(y2)
+            self.insert(y1, self.get_line_length(y1), text)
 
     def get_line(self, y):
-        return self.lines[y][ : ]
+        return self.table.text(self.line_start(y), self.line_end(y))
 
     def get_lines(self):
-        return self.lines[:]
+        """Returns a view of the current lines, which does not change when the buffer is edited"""
+        # the table is immutable, so a view of it behaves like a copy
+        return Lines(self.table)
 
     def pop_line(self, y):
-        self.lines.pop(y) 
+        if self.get_text_height() == 1:
+            self.replace(0, len(self.table), '')
+        elif y == self.get_text_height() - 1:
+            # remove the newline before the last line
+            self.replace(self.line_start(y) - 1, len(self.table), '')
+        else:
+            self.replace(self.line_start(y), self.line_start(y + 1), '')
 
     def insert_line(self, y, text = ''):
-        self.lines.insert(y, text)
+        if y >= self.get_text_height():
+            self.replace(len(self.table), len(self.table), '\n' + text)
+        else:
+            offset = self.line_start(y)
+            self.replace(offset, offset, text + '\n')
 
     def split_line(self, y, x):
-        dif = self.get_substr(y, x, None) # None = to end of line
-        self.lines[y] = self.get_substr(y, 0, x)
-        self.insert_line(y + 1, dif)
+        offset = self.get_span(y, x, None)[0]
+        self.replace(offset, offset, '\n')
         
     def get_header(self, file_name, mode, cur_command):
         self.update_screen_size()
@@ -102,25 +513,106 @@ class Buffer:
             ('Editing ' + file_name,        4),
             (' ' * 20,                      2),
             (cur_command,                   6),
+            (' ' * 4,                       2),
+            (self.status,                   6),
         ]
         justified_right = [
             ('Mode: ' + mode,               5),
             (' ' * 10,                      2),
         ]
         padding = (self.get_width() - sum([len(i) for i, j in (justified_left + justified_right)]))
+        # rather than pushing the mode onto the next row, the gaps are narrowed first, then the file name
+        # is cut off, and the status is only cut off last. A space is kept before the mode
+        for side, index, least in HEADER_SHRINK_ORDER:
+            if padding >= 1:
+                break
+            items = justified_left if side == 'left' else justified_right
+            text, color = items[index]
+            cut = max(least, len(text) + padding - 1)
+            items[index] = (text[ : cut], color)
+            padding += len(text) - cut
+        if self.latency is not None and padding > 4:
+            # p50/p99 milliseconds of each stage of handling a key, cut off to fit
+            summary = self.latency.get_summary()[ : padding - 4]
+            justified_left.extend([(' ' * 4, 2), (summary, 5)])
+            padding -= 4 + len(summary)
         return justified_left + [(' ' * padding, 2)] + justified_right + [('─' * self.width, 2)]
 
-    def get_key(self):
-        return normalizekey(self.stdscr.getkey())
+    def read_key(self, window):
+        key = window.getkey()
+        # the wait for the first key is not timed, only reading the rest of it
+        with measure(self.latency, 'get_key'):
+            if key == PASTE_START[0]:
+                paste = self.read_paste(window)
+                if paste is not None:
+                    return paste
+            return normalizekey(key)
+
+    def read_paste(self, window):
+        """
+        Reads the rest of a bracketed paste after its first character.
+        If the keys after it do not start a paste, they are put back and None is returned.
+        """
+        window.nodelay(True)
+        consumed = []
+        try:
+            for expected in PASTE_START[1 : ]:
+                try:
+                    consumed.append(window.get_wch())
+                except error:
+                    break
+                if consumed[-1] != expected:
+                    break
+        finally:
+            window.nodelay(False)
+        if ''.join([str(key) for key in consumed]) != PASTE_START[1 : ]:
+            for key in reversed(consumed):
+                if isinstance(key, str):
+                    self.terminal.unget_wch(key)
+                else:
+                    self.terminal.ungetch(key)
+            return None
+        # read the pasted text as it is, without translating escape sequences into keys
+        window.keypad(False)
+        text = []
+        try:
+            while len(text) < len(PASTE_END) or ''.join(text[-len(PASTE_END) : ]) != PASTE_END:
+                text.append(window.get_wch())
+        finally:
+            window.keypad(True)
+        return PasteKey(''.join(text[ : -len(PASTE_END)]))
+
+    def get_key(self, window = None, timeout = -1):
+        """
+        Waits for a key from window, which is the text window if not given.
+        If timeout is not negative, returns None if no key is typed within timeout milliseconds.
+        """
+        if window is None:
+            self.renderer.make_windows()
+            window = self.renderer.text_win
+        if timeout < 0:
+            return self.read_key(window)
+        window.timeout(timeout)
+        try:
+            return self.read_key(window)
+        except error:
+            return None
+        finally:
+            window.timeout(-1)
+
+    def get_queued_key(self):
+        """Returns a key that has already been typed, or None if there is no such key"""
+        return self.get_key(timeout = 0)
 
     def display_text(self, text):
         """Displays an array of strings to the screen. Waits for user input before continuing"""
         self.update_screen_size()
+        self.renderer.invalidate()
         self.stdscr.erase()
         for line in text:
             self.stdscr.addstr(f'{PADCHAR}{line}\n')
         self.stdscr.addstr(PADCHAR)
-        self.get_key()
+        self.get_key(self.stdscr)
 
     def display_prompt(self, text):
         """
@@ -128,6 +620,7 @@ class Buffer:
         """
         key = None
         res = ''
+        self.renderer.invalidate()
         while key != 'KEY_NEWLINE':
             if key == 'KEY_BACKSPACE':
                 res = res[ : -1]
@@ -136,7 +629,7 @@ class Buffer:
             self.stdscr.erase()
             self.stdscr.addstr(f'{PADCHAR}{text}\n')
             self.stdscr.addstr(f'{PADCHAR}{res}')
-            key = self.get_key()
+            key = self.get_key(self.stdscr)
         return res
 
     def display_confirm(self, text, password):
@@ -153,6 +646,7 @@ class Buffer:
         """
         cur_index = 0
         key = None
+        self.renderer.invalidate()
         while key != 'KEY_NEWLINE':
             if key == 'KEY_UP':
                 cur_index = max(cur_index - 1, 0)
@@ -164,64 +658,15 @@ class Buffer:
             for index, value in enumerate(choices):
                 self.stdscr.addstr('\n')
                 self.stdscr.addstr(PADCHAR)
-                self.stdscr.addstr(value, color_pair(7 if index == cur_index else 1))
+                self.stdscr.addstr(value, self.terminal.color_pair(7 if index == cur_index else 1))
             self.stdscr.addstr(f'\n\n{PADCHAR}') 
-            key = self.get_key()  
+            key = self.get_key(self.stdscr)
         return cur_index 
 
     def flush(self, header, caret, select_start_pos, select_end_pos, scr_topleft, scr_bottomright):
         """Displays buffer to the screen"""
         self.update_screen_size()
-        self.stdscr.erase()
-        # header
-        for text, color in header:
-            self.stdscr.addstr(text, color_pair(color))
-        text_selected = select_start_pos is not None
-        # display lines
-        displayed_lines = self.lines[scr_topleft.y : min(len(self.lines), scr_bottomright.y)]
-        for index, line in enumerate(displayed_lines):
-            self.stdscr.addstr(PADCHAR)
-            if len(line) >= scr_topleft.x:
-                # inclusive, position of line start and line end of displayed line
-                ln_start = Position(scr_topleft.y + index, scr_topleft.x)
-                ln_end = Position(scr_topleft.y + index, scr_topleft.x + self.screen_width())
-                displayed_line = line[ln_start.x : min(len(line), scr_bottomright.x - 1)]
-                if text_selected:
-                    # whether start position and end position of line are between selection
-                    start_between = ln_start.is_between(select_start_pos, select_end_pos)
-                    end_between = ln_end.is_between(select_start_pos, select_end_pos)
-                    # whether selection is between start and end position
-                    select_start_between = select_start_pos.is_between(ln_start, ln_end)
-                    select_end_between = select_end_pos.is_between(ln_start, ln_end)
-                    if start_between and end_between:
-                        # completely enclosed
-                        self.stdscr.addstr(displayed_line, color_pair(7))
-                    elif start_between:
-                        # only start between selection
-                        # end is on same line
-                        # only starting portion is highlighted
-                        self.stdscr.addstr(displayed_line[ : select_end_pos.x - ln_start.x + 1], color_pair(7))
-                        self.stdscr.addstr(displayed_line[select_end_pos.x - ln_start.x + 1 : ])
-                    elif end_between:
-                        # only end between selection
-                        # start is on same
-                        # only ending portion is highlighted
-                        self.stdscr.addstr(displayed_line[ : select_start_pos.x - ln_start.x])
-                        self.stdscr.addstr(displayed_line[select_start_pos.x - ln_start.x : ], color_pair(7))
-                    elif select_start_between and select_end_between:
-                        # selection is all on this line
-                        # start and end not highlighted
-                        self.stdscr.addstr(displayed_line[ : select_start_pos.x - ln_start.x])
-                        self.stdscr.addstr(
-                            displayed_line[select_start_pos.x - ln_start.x : select_end_pos.x - ln_start.x + 1],
-                            color_pair(7)
-                        )
-                        self.stdscr.addstr(displayed_line[select_end_pos.x + 1  - ln_start.x : ])
-                    else:
-                        # not enclosed by selection at all
-                        self.stdscr.addstr(displayed_line)
-                else:
-                    self.stdscr.addstr(displayed_line)
-            if index != len(displayed_lines) - 1:
-                self.stdscr.addstr('\n')
-        self.stdscr.move(caret.y - scr_topleft.y + HEADER_LEN, caret.x - scr_topleft.x + PAD_LEN)
+        self.update_highlighter(scr_bottomright.y)
+        self.renderer.render(
+            self, header, caret, select_start_pos, select_end_pos, scr_topleft, scr_bottomright
+        )
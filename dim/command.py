@@ -1,15 +1,17 @@
 import os
+import re
 import sys
 
 from base import *
 from buffer import *
 from keys import *
+from marks import SEARCH_HIT
 from position import *
 from state import StateManager
 
 class CommandMode(Mode):
-    def __init__(self, buffer, state_manager, caret, file_name, args):
-        super().__init__(buffer, state_manager, caret, file_name, args)
+    def __init__(self, buffer, state_manager, caret, file_name, args, registers):
+        super().__init__(buffer, state_manager, caret, file_name, args, registers)
         self.name = MODE_COMMAND
         self.cur_command = ''
 
@@ -26,10 +28,39 @@ class CommandMode(Mode):
                 amt = 1
             self.buffer.delete_substr(self.caret.y, self.caret.x, self.caret.x + amt)
             self.push_state()
+        elif command == 'p':
+            # put the text in the register named by the first argument before the caret
+            text = self.registers.get_text(args[0] if args else None)
+            if text is None:
+                self.buffer.status = f'Nothing is copied into {args[0]}' if args else 'Nothing has been copied'
+            elif text:
+                offset = self.buffer.get_offset(self.caret)
+                self.buffer.replace(offset, offset, text)
+                self.caret = self.buffer.get_position(offset + len(text))
+                self.push_state()
+        elif command in ['n', 'N'] and self.buffer.search is not None:
+            # go to the next or previous match
+            pos = self.buffer.find_match(self.caret, backwards = command == 'N')
+            if pos is not None:
+                self.caret = pos
+                self.buffer.set_mark(SEARCH_HIT, pos)
         return MODE_COMMAND
 
+    def parse_search(self, pattern):
+        """Goes to the first match of a pattern after the caret. An empty pattern stops highlighting matches"""
+        if not pattern:
+            self.buffer.stop_search()
+            return MODE_COMMAND
+        try:
+            self.buffer.start_search(pattern)
+        except re.error as e:
+            self.buffer.status = f'Invalid pattern: {e}'
+            return MODE_COMMAND
+        return self.parse_command('n')
+
     def parse_key(self, key):
         if key == 'KEY_ESCAPE':
+            self.finish_save(wait = True)
             if not (self.state_manager.saved or self.args.read_only):
                 res = self.buffer.display_confirm(
                     'Do you want to quit without saving? (y/n): ',
@@ -37,17 +68,18 @@ class CommandMode(Mode):
                 )
                 if not res:
                     return MODE_COMMAND
+            self.buffer.close_swap()
             sys.exit(0)
         elif key == 'KEY_BACKSPACE':
             self.cur_command = self.cur_command[ : -1]
         elif key == 'KEY_LEFT':
-            self.caret.move_left(self.buffer)
+            self.caret.move_left(self.buffer, self.take_count())
         elif key == 'KEY_RIGHT':
-            self.caret.move_right(self.buffer)
+            self.caret.move_right(self.buffer, self.take_count())
         elif key == 'KEY_UP':
-            self.caret.move_up(self.buffer)
+            self.caret.move_up(self.buffer, self.take_count())
         elif key == 'KEY_DOWN':
-            self.caret.move_down(self.buffer)
+            self.caret.move_down(self.buffer, self.take_count())
         elif key == 'KEY_PAGE_UP':
             self.caret = Position(0, 0)
         elif key == 'KEY_PAGE_DOWN':
@@ -61,9 +93,20 @@ class CommandMode(Mode):
             self.caret.x = self.buffer.get_line_length(self.caret.y)
         elif key == 'KEY_NEWLINE':
             try:
-                return self.parse_command(*self.parse_args(self.cur_command))
+                if self.cur_command.startswith('/'):
+                    # the pattern may contain brackets, so it is not parsed as arguments
+                    return self.parse_search(self.cur_command[1 : ])
+                return self.parse_repeated(self.cur_command)
             finally:
                 self.cur_command = ''
+        elif key in ['n', 'N'] and self.buffer.search is not None and (not self.cur_command or self.cur_command.isdecimal()):
+            # going to the next or previous match doesn't wait for enter
+            command, self.cur_command = (self.cur_command + key, '')
+            return self.parse_repeated(command)
+        elif key == 'KEY_PASTE':
+            # paste the first line of the text into the command
+            text = key.text.split('\n')[0]
+            self.cur_command = (self.cur_command + text)[ : MAX_COMMAND_LENGTH]
         elif ischar(key):
             if len(self.cur_command) < MAX_COMMAND_LENGTH:
                 self.cur_command += key
@@ -1,13 +1,35 @@
-import traceback
+# the startup timer is imported first, so that it also times the other imports
+from startup import StartupTimer
+STARTUP = StartupTimer()
+
+import atexit
 from curses import *
 
 from argparser import Argparser
 from editor import Editor
 
+STARTUP.mark('imports')
+
+def print_startup():
+    """Prints how long each phase of starting the editor took, once the screen is closed"""
+    print('Startup time:')
+    for line in STARTUP.get_report():
+        print('  ' + line)
+
 def main(stdscr):
+    STARTUP.mark('curses setup')
     args = Argparser.get_args()
+    STARTUP.mark('arguments')
+    if args.startup_time:
+        atexit.register(print_startup)
+    profiler = None
+    if args.profile is not None or args.profile_stacks is not None:
+        # cProfile is only imported when it is used
+        from profiler import SessionProfiler
+        profiler = SessionProfiler(args.profile, args.profile_stacks)
+        profiler.start()
     try:
-        Editor(stdscr, args).launch()
+        Editor(stdscr, args, STARTUP).launch()
     except Exception as e:
         error_type = type(e)
         error_msg = str(e)
@@ -19,8 +41,13 @@ def main(stdscr):
         else:
             print('A fatal error has occured.\n')
             if args.debug:
+                import traceback
                 print(traceback.format_exc())
     finally:
+        if profiler is not None:
+            # the profile is written however the session ends, including after a crash
+            for message in profiler.stop():
+                print(message)
         print('Exited the editor.')
 
 if __name__ == '__main__':
@@ -1,19 +1,26 @@
+import atexit
 import os
+import signal
 import sys
 import time
-import traceback
 from curses import *
 
 from base import *
 from buffer import *
 from command import CommandMode
+from encoding import detect_encoding, read_text
+from follow import FileFollower
 from insert import InsertMode
 from keys import *
+from latency import LatencyStats, measure
+from loader import LAZY_LOAD_LIMIT
 from position import *
-from select import SelectMode
+from registers import Registers
+from selection import SelectMode
+from startup import mark
 from state import StateManager
-
-### TODO add syntax highlighting (highlighting overrides syntax highlighting) ###
+from swap import get_swap_path, is_current, is_running, read_swap, remove_swap
+from syntax import get_lexer
 
 MODE_BY_NAME = {
     MODE_COMMAND: CommandMode,
@@ -21,48 +28,183 @@ MODE_BY_NAME = {
     MODE_SELECT: SelectMode
 }
 
-# maximum amount of characters for undo and redo to be allowed
-DISALLOW_STATE_LIMIT = 5000000
+# files larger than this many bytes keep their undo history within a memory budget
+LARGE_FILE_LIMIT = 5000000
+# bytes of compressed undo history kept in memory for large files
+LARGE_FILE_HISTORY_BUDGET = 16 * 1024 * 1024
+# milliseconds between redraws while a file is being saved or searched in the background
+BACKGROUND_POLL = 100
+# most frames drawn each second. Keys that arrive faster than this are handled together before the next frame
+MAX_FRAME_RATE = 60
+# milliseconds between checks for typed keys where the event loop can't wait for the terminal, as on Windows
+INPUT_POLL = 10
 
 class Editor:
-    def __init__(self, stdscr, args):
+    def __init__(self, stdscr, args, startup = None, terminal = None):
+        """
+        Creates an editor drawn to stdscr. startup is a StartupTimer which times the phases until the first frame.
+        terminal makes the curses calls outside of a window, which is the real terminal if not given.
+        """
         self.args = args
         self.debug_mode = args.debug
-        self.script_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)))
+        self.startup = startup
         # set initial values
-        self.buffer = Buffer(stdscr)
+        self.buffer = Buffer(stdscr, terminal)
+        mark(self.startup, 'screen setup')
         self.state_manager = StateManager()
+        self.registers = Registers()
         self.caret = Position(0, 0)
         self.scr_topleft = Position(0, 0) # inclusive
         self.scr_bottomright = Position(self.buffer.screen_height(), self.buffer.screen_width()) # inclusive
         self.file_name = 'None'
         self.mode = None
-        self.allow_state = True
+        if self.debug_mode:
+            self.buffer.latency = LatencyStats()
+            atexit.register(self.print_latency)
+        self.large_file = False
+        self.wrapped = False # whether the screen was last scrolled with long lines wrapped
+        self.follower = None # watches the file for added lines when it is followed
         # try to find a file
         try:
             if self.args.file is not None:
-                with open(args.file, 'r') as edit_file:
-                    text = edit_file.read()
-                    if len(text) > DISALLOW_STATE_LIMIT:
-                        self.allow_state = False
+                size = os.path.getsize(args.file)
+                encoding = detect_encoding(args.file)
+                if args.follow:
+                    self.follow(encoding, size)
+                elif size > LAZY_LOAD_LIMIT:
+                    # only the part of the file on screen is read before the first frame
+                    self.buffer.load_file(args.file, encoding)
+                else:
+                    text, encoding = read_text(args.file, encoding)
                     self.buffer.load_text(text)
+                    self.buffer.encoding = encoding
+                if not encoding.is_default():
+                    self.buffer.status = f'Opened as {encoding}'
+                if size > LARGE_FILE_LIMIT:
+                    self.large_file = True
+                    self.state_manager.memory_budget = LARGE_FILE_HISTORY_BUDGET
                 self.file_name = os.path.basename(args.file)
+                if not self.large_file:
+                    self.buffer.set_lexer(get_lexer(args.file))
         except (FileNotFoundError, PermissionError, OSError) as e:
             print('The path given is invalid or inaccessible.\n')
             sys.exit(1)
         except UnicodeDecodeError as e:
             print('The encoding of the file is not supported.\n')
             sys.exit(1)
-        self.args.allow_state = self.allow_state
-        # push initial state
-        if self.allow_state:
-            self.state_manager.push_state(self.caret.copy(), self.buffer.get_content())
+        self.buffer.set_wrap(args.wrap)
+        mark(self.startup, 'file loading')
+        # start the journal from the loaded text
+        self.state_manager.clear_stack(self.caret)
+        if self.args.file is not None and not self.args.read_only:
+            self.recover()
+            if hasattr(signal, 'SIGHUP'):
+                # a dropped connection exits normally so that the last edits reach the swap file
+                signal.signal(signal.SIGHUP, lambda signum, frame: sys.exit(1))
+            mark(self.startup, 'swap file')
+
+    def follow(self, encoding, size):
+        """Opens a file that is still being written to, showing its last lines and following the lines added to it"""
+        if size > LAZY_LOAD_LIMIT:
+            self.buffer.load_file(self.args.file, encoding)
+            # lines added after the file was mapped are read by the follower
+            self.follower = FileFollower(self.args.file, encoding, self.buffer.loader.size)
+            self.buffer.poll_loader(wait = True)
+        else:
+            # the whole file is read by the first poll
+            self.buffer.load_text('')
+            self.buffer.encoding = encoding
+            self.follower = FileFollower(self.args.file, encoding, len(encoding.bom))
+        self.add_followed(self.follower.poll())
+        self.caret.y = self.buffer.get_text_height() - 1
+
+    def add_followed(self, polled):
+        """
+        Adds the text that a poll of the followed file returned, and drops the oldest lines
+        over the limit. A caret on the last line stays on it, so the screen scrolls along.
+        """
+        text, restarted = polled
+        at_end = self.caret.y == self.buffer.get_text_height() - 1
+        if restarted:
+            self.buffer.load_text('')
+            self.caret.y, self.caret.x = (0, 0)
+        self.buffer.append_text(text)
+        excess = self.buffer.get_text_height() - max(1, self.args.follow_lines)
+        if excess > 0:
+            self.buffer.drop_lines(excess)
+            self.caret.y = max(0, self.caret.y - excess)
+            # keep showing the same lines
+            shift = min(excess, self.scr_topleft.y)
+            self.scr_topleft.y -= shift
+            self.scr_bottomright.y -= shift
+        if restarted or excess > 0:
+            # the journal holds offsets into lines that are gone
+            self.state_manager.clear_stack(self.caret)
+        if at_end:
+            self.caret.y = self.buffer.get_text_height() - 1
+        self.caret.x = min(self.caret.x, self.buffer.get_line_length(self.caret.y))
+
+    def recover(self):
+        """
+        Offers to recover the edits in a swap file left behind by an editor that did not exit,
+        then starts autosaving to the swap file.
+        """
+        swap_path = get_swap_path(self.args.file)
+        found = read_swap(swap_path)
+        if found is None:
+            if os.path.lexists(swap_path):
+                # a swap file that another user or program left there is neither read nor replaced
+                self.warn_swap(['There is a swap file for this file which can\'t be used:', swap_path])
+            else:
+                self.buffer.start_swap(self.args.file)
+            return
+        info, pid, records, end = found
+        if is_running(pid):
+            self.warn_swap([f'This file is already open in another editor (process {pid}), which autosaves to:', swap_path])
+            return
+        if not records:
+            remove_swap(swap_path)
+            self.buffer.start_swap(self.args.file)
+            return
+        message = [
+            f'Found a swap file with {len(records)} unsaved edits to this file:',
+            swap_path, ''
+        ]
+        if not is_current(info, self.args.file):
+            message.extend(['The file has been changed since, so the edits can no longer be recovered.', ''])
+            if self.buffer.display_choose(message, ['Discard the edits', 'Quit']) == 1:
+                sys.exit(0)
+            remove_swap(swap_path)
+            self.buffer.start_swap(self.args.file)
+            return
+        choice = self.buffer.display_choose(message, ['Recover the edits', 'Discard the edits', 'Quit'])
+        if choice == 2:
+            sys.exit(0)
+        if choice == 1:
+            remove_swap(swap_path)
+            self.buffer.start_swap(self.args.file)
+            return
+        self.buffer.poll_loader(wait = True)
+        for offset, removed, inserted in records:
+            if offset + removed > self.buffer.get_length():
+                break
+            self.buffer.replace(offset, offset + removed, inserted)
+            self.caret = self.buffer.get_position(offset + len(inserted))
+        # the recovered edits are undone in one step
+        self.state_manager.push_state(self.caret, self.buffer.take_changes())
+        self.buffer.start_swap(self.args.file, resume_at = end)
+
+    def warn_swap(self, message):
+        """Warns that edits will not be autosaved because of the swap file in message, and offers to quit"""
+        message.extend(['', 'Edits made in this editor will not be autosaved.', ''])
+        if self.buffer.display_choose(message, ['Continue', 'Quit']) == 1:
+            sys.exit(0)
 
     def sync(self):
         """
         Syncs some variables between this object and its Mode object.
         """
-        attrs = ['buffer', 'state_manager', 'caret', 'file_name', 'args', 'script_dir', 'debug_mode']
+        attrs = ['buffer', 'state_manager', 'caret', 'file_name', 'args', 'debug_mode']
         for attr in attrs:
             setattr(self, attr, getattr(self.mode, attr))
 
@@ -76,6 +218,13 @@ class Editor:
         self.scr_bottomright = Position(self.buffer.screen_height(), self.buffer.screen_width())
 
     def scroll_screen(self):
+        if (self.buffer.wrap is not None) != self.wrapped:
+            # the screen scrolls by rows instead of lines and columns, so start from the top left
+            self.wrapped = self.buffer.wrap is not None
+            self.resize_screen()
+        if self.wrapped:
+            self.scroll_wrapped()
+            return
         # scroll up down
         if self.scr_topleft.y > self.caret.y:
             self.scr_bottomright.y -= self.scr_topleft.y - self.caret.y
@@ -83,43 +232,119 @@ class Editor:
         elif self.scr_bottomright.y <= self.caret.y:
             self.scr_topleft.y += self.caret.y - self.scr_bottomright.y + 1
             self.scr_bottomright.y = self.caret.y + 1
-        # scroll left right
-        if self.caret.x < self.scr_topleft.x:
-            self.scr_bottomright.x -= self.scr_topleft.x - self.caret.x
-            self.scr_topleft.x = self.caret.x
-        elif self.caret.x >= self.scr_bottomright.x:
-            self.scr_topleft.x += self.caret.x - self.scr_bottomright.x + 1
-            self.scr_bottomright.x = self.caret.x + 1
+        # scroll left right, by columns rather than characters
+        layout = self.buffer.layouts.get(self.caret.y)
+        column = layout.get_column(self.caret.x)
+        end = column + layout.get_char_width(self.caret.x) - 1 # the last column of the character under the caret
+        if column < self.scr_topleft.x:
+            self.scr_bottomright.x -= self.scr_topleft.x - column
+            self.scr_topleft.x = column
+        elif end >= self.scr_bottomright.x:
+            self.scr_topleft.x += end - self.scr_bottomright.x + 1
+            self.scr_bottomright.x = end + 1
+
+    def scroll_wrapped(self):
+        """Scrolls by screen rows when long lines are wrapped, so that the screen never scrolls sideways"""
+        wrap = self.buffer.wrap
+        # the line at the top of the screen may have been shortened or removed
+        y = min(self.scr_topleft.y, self.buffer.get_text_height() - 1)
+        top = (y, min(self.scr_topleft.x // wrap.width, wrap.get_rows(y) - 1))
+        top = wrap.scroll(top, wrap.get_row(self.caret), self.buffer.screen_height())
+        self.scr_topleft = Position(top[0], top[1] * wrap.width)
+        self.scr_bottomright = Position(top[0] + self.buffer.screen_height(), self.scr_topleft.x + self.buffer.screen_width())
+
+    def poll_loader(self):
+        """Adds any newly loaded part of the file to the buffer"""
+        try:
+            self.buffer.poll_loader()
+        except UnicodeDecodeError:
+            print('The encoding of the file is not supported.\n')
+            sys.exit(1)
 
     def display(self):
+        self.poll_loader()
+        self.mode.finish_save()
+        self.buffer.poll_search()
         self.buffer.update_screen_size()
-        self.scroll_screen()
+        with measure(self.buffer.latency, 'scroll_screen'):
+            self.scroll_screen()
         self.sync()
-        self.buffer.flush(
-            self.buffer.get_header(
-                self.file_name,
-                self.mode.name,
-                self.mode.cur_command if self.mode.name in [MODE_COMMAND, MODE_SELECT] else ''
-            ),
-            self.caret,
-            self.mode.select_start_pos if self.mode.name == MODE_SELECT else None,
-            self.mode.select_end_pos if self.mode.name == MODE_SELECT else None,
-            self.scr_topleft,
-            self.scr_bottomright
+        mode_name = self.mode.name
+        if self.registers.recording is not None:
+            mode_name += f' (recording {self.registers.recording})'
+        header = self.buffer.get_header(
+            self.file_name,
+            mode_name,
+            self.mode.cur_command if self.mode.name in [MODE_COMMAND, MODE_SELECT] else ''
         )
+        with measure(self.buffer.latency, 'flush'):
+            self.buffer.flush(
+                header,
+                self.caret,
+                self.mode.select_start_pos if self.mode.name == MODE_SELECT else None,
+                self.mode.select_end_pos if self.mode.name == MODE_SELECT else None,
+                self.scr_topleft,
+                self.scr_bottomright
+            )
 
     def get_key(self):
-        return self.buffer.get_key()
+        """Waits for a key without the event loop, as the benchmarks do"""
+        # wake up regularly to show the progress of a save or search
+        busy = self.buffer.saver is not None or self.buffer.is_searching()
+        return self.buffer.get_key(timeout = BACKGROUND_POLL if busy else -1)
+
+    def handle_key(self, key):
+        """Handles a typed key, along with the keys of any macro it replays"""
+        self.registers.record(key, not getattr(self.mode, 'cur_command', ''))
+        self.run_key(key)
+        if self.registers.replaying:
+            self.replay_macros()
+
+    def replay_macros(self):
+        """
+        Handles the keys of the macros being replayed as one edit, which is undone in one step.
+        The screen is only drawn once they have all been handled.
+        """
+        self.state_manager.start_batch()
+        try:
+            while (key := self.registers.next_key()) is not None:
+                self.run_key(key)
+        finally:
+            self.state_manager.end_batch(self.caret)
+
+    def run_key(self, key):
+        if key == '`' and self.debug_mode:
+            self.buffer.close_swap()
+            sys.exit(0)
+        elif key == 'KEY_RESIZE':
+            self.buffer.update_screen_size()
+            self.resize_screen()
+        else:
+            self.poll_loader()
+            with measure(self.buffer.latency, 'parse_key'):
+                new_mode = self.mode.parse_key(key)
+            if self.mode.name != new_mode:
+                self.mode = MODE_BY_NAME[new_mode](*self.mode.get_properties())
+            self.sync()
+
+    def print_latency(self):
+        """Prints a histogram of how long each stage of handling a key took, once the screen is closed"""
+        print('Time spent handling keys:')
+        for line in self.buffer.latency.get_histogram():
+            print(line)
 
     def get_startup_msg(self):
         message = []
-        if self.args.read_only:
+        if self.args.read_only and self.follower is None:
+            # a followed file is always read only, and waiting for a key would hold up its new lines
             message.extend([
                 'The editor has been opened in read only mode.', ''
             ])
-        if not self.allow_state:
+        if self.large_file:
+            budget = self.state_manager.memory_budget // (1024 * 1024)
             message.extend([
-                'The file size is large. Undo and redo are disabled.', ''
+                f'The file size is large. Undo history is limited to {budget} MB of memory.',
+                'Older history is kept in a temporary file.', ''
             ])
         if message:
             message.extend(['Press any key to continue.', ''])
@@ -129,7 +354,8 @@ class Editor:
         if self.debug_mode:
             if self.args.file is None:
                 text_list = ['NONE']
-                debug_dir = os.path.join(self.script_dir, 'debug')
+                # the folder is only looked up when it is listed
+                debug_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'debug')
                 if os.path.exists(debug_dir):
                     text_list.extend(sorted([file_name for file_name in os.listdir(debug_dir)]))
                 choice = self.buffer.display_choose(
@@ -145,9 +371,7 @@ class Editor:
                     file_name = os.path.join(debug_dir, text_list[choice])
                     with open(file_name, 'r') as text:
                         self.buffer.load_text(text.read())
-                self.state_manager.clear_stack()
-                if self.allow_state:
-                    self.state_manager.push_state(self.caret.copy(), self.buffer.get_content())
+                self.state_manager.clear_stack(self.caret)
             else:
                 self.buffer.display_text([
                     'You have launched the editor in debug mode...',
@@ -156,24 +380,107 @@ class Editor:
         # startup message
         if startup_msg := self.get_startup_msg():
             self.buffer.display_text(startup_msg)
+        if self.debug_mode or startup_msg:
+            mark(self.startup, 'startup messages')
         # startup mode
         self.mode = CommandMode(
-            self.buffer, self.state_manager, self.caret, self.file_name, self.args
+            self.buffer, self.state_manager, self.caret, self.file_name, self.args, self.registers
         )
         self.display()
-        while True:
-            key = self.get_key()
-            if key == '`' and self.debug_mode:
-                sys.exit(0)
-            elif key == 'KEY_RESIZE':
-                self.buffer.update_screen_size()
-                self.resize_screen()
-            else:
-                new_mode = self.mode.parse_key(key)
-                if self.mode.name != new_mode:
-                    self.mode = MODE_BY_NAME[new_mode](*self.mode.get_properties())
-                self.sync()
-            self.display()
+        mark(self.startup, 'first frame')
+        # asyncio takes longer to import than the rest of the editor, so it is imported after the first frame
+        import asyncio
+        asyncio.run(self.run())
+
+    async def run(self):
+        """
+        Handles keys as the terminal has them and draws frames in between, at most MAX_FRAME_RATE
+        times a second. Saves, searches and background jobs carry on while waiting for keys.
+        """
+        import asyncio
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event() # set when there may be keys to handle or a frame to draw
+        self.frame_requested = False
+        self.loop_error = None
+        self.loop.set_exception_handler(self.handle_loop_error)
+        self.buffer.tasks.start(self.loop, self.request_frame)
+        self.timers = {} # the next call of each periodic callback
+        self.watch()
+        input_fd = sys.stdin.fileno()
+        try:
+            self.loop.add_reader(input_fd, self.wake.set)
+        except NotImplementedError:
+            input_fd = None
+            self.poll_input()
+        if hasattr(signal, 'SIGWINCH'):
+            self.loop.add_signal_handler(signal.SIGWINCH, self.terminal_resized)
+        last_frame = 0
+        # keys may have been typed before the loop started
+        self.wake.set()
+        try:
+            while True:
+                await self.wake.wait()
+                self.wake.clear()
+                if self.loop_error is not None:
+                    raise self.loop_error
+                # keys that arrive before the next frame is due are handled together
+                await asyncio.sleep(max(0, last_frame + 1 / MAX_FRAME_RATE - time.perf_counter()))
+                if self.handle_queued_keys() or self.frame_requested:
+                    self.frame_requested = False
+                    self.display()
+                    last_frame = time.perf_counter()
+        finally:
+            if input_fd is not None:
+                self.loop.remove_reader(input_fd)
+            if hasattr(signal, 'SIGWINCH'):
+                self.loop.remove_signal_handler(signal.SIGWINCH)
+            for timer in self.timers.values():
+                timer.cancel()
+            self.buffer.tasks.stop()
+
+    def handle_queued_keys(self):
+        """Handles the keys typed since the last frame, up to the batch limits. Returns whether any were handled"""
+        deadline = time.perf_counter() + self.args.batch_time / 1000
+        handled = 0
+        while handled < self.args.batch_keys and (handled == 0 or time.perf_counter() < deadline):
+            key = self.buffer.get_queued_key()
+            if key is None:
+                return handled > 0
+            self.handle_key(key)
+            handled += 1
+        # the rest of the keys are handled after the next frame
+        self.wake.set()
+        return True
+
+    def request_frame(self):
+        self.frame_requested = True
+        self.wake.set()
+
+    def watch(self):
+        """Reads the lines added to a followed file, and draws the progress of saves and searches"""
+        self.timers['watch'] = self.loop.call_later(BACKGROUND_POLL / 1000, self.watch)
+        if self.follower is not None and not self.buffer.tasks.is_running('follow'):
+            # the file is read on a worker thread, so that a slow disk doesn't hold up keys
+            follower = self.follower
+            self.buffer.tasks.run('follow', lambda job: follower.poll(), done = self.add_followed)
+        if self.buffer.saver is not None or self.buffer.is_searching():
+            self.request_frame()
+
+    def poll_input(self):
+        self.timers['input'] = self.loop.call_later(INPUT_POLL / 1000, self.poll_input)
+        self.wake.set()
+
+    def terminal_resized(self):
+        """Resizes the screen to the terminal, which curses would have done if the event loop hadn't taken its signal"""
+        size = os.get_terminal_size(sys.__stdout__.fileno())
+        resizeterm(size.lines, size.columns)
+        self.run_key('KEY_RESIZE')
+        self.request_frame()
+
+    def handle_loop_error(self, loop, context):
+        """Raises an error from a callback of the event loop in the main loop, where it ends the editor"""
+        self.loop_error = context.get('exception') or RuntimeError(context['message'])
+        self.wake.set()
 
 if __name__ == '__main__':
     print('This is a helper file used by dim. If you are looking to launch the editor, try dim.py')
@@ -0,0 +1,100 @@
+import codecs
+import io
+import os
+
+# number of bytes at the start of a file that its encoding is guessed from
+SAMPLE_SIZE = 64 * 1024
+# number of bytes read and decoded at a time
+DECODE_CHUNK = 1024 * 1024
+# bytes that are not valid in the encoding are kept as lone surrogates, which are encoded back
+# into the same bytes when the file is saved
+ERRORS = 'surrogateescape'
+# surrogateescape can't stand for the bytes of UTF-16 and UTF-32, which are often below 0x80,
+# so unpaired surrogates in them are kept as they are instead
+WIDE_ERRORS = 'surrogatepass'
+# bytes in each code unit of the encodings that use WIDE_ERRORS
+UNIT_SIZES = {'utf-16': 2, 'utf-16-le': 2, 'utf-16-be': 2, 'utf-32': 4, 'utf-32-le': 4, 'utf-32-be': 4}
+
+# byte order marks and the encodings of the text after them. The mark of UTF-32 LE starts
+# with the mark of UTF-16 LE, so it is checked first
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be')
+]
+
+class Encoding:
+    """The encoding of a file, which is the codec of its text and the byte order mark written before it"""
+    __slots__ = ('name', 'bom', 'newline', 'errors')
+
+    def __init__(self, name, bom = b''):
+        self.name = codecs.lookup(name).name
+        self.bom = bom
+        self.newline = '\n'.encode(self.name)
+        self.errors = WIDE_ERRORS if self.name in UNIT_SIZES else ERRORS
+
+    def decode(self, data):
+        return data.decode(self.name, self.errors)
+
+    def get_decoder(self):
+        return codecs.getincrementaldecoder(self.name)(self.errors)
+
+    def is_default(self):
+        return self.name == 'utf-8' and not self.bom
+
+    def __repr__(self):
+        return self.name + (' BOM' if self.bom else '')
+
+def guess_encoding(sample):
+    """Guesses the encoding of a file from the bytes at its start"""
+    for bom, name in BOMS:
+        if sample.startswith(bom):
+            return Encoding(name, bom)
+    # most characters of text in UTF-16 are ASCII, which have a zero as their high byte
+    half = len(sample) // 2
+    even_zeros, odd_zeros = (sample[0 : : 2].count(0), sample[1 : : 2].count(0))
+    if half and odd_zeros > half * 0.3 and even_zeros < half * 0.05:
+        return Encoding('utf-16-le')
+    if half and even_zeros > half * 0.3 and odd_zeros < half * 0.05:
+        return Encoding('utf-16-be')
+    try:
+        # a character cut off at the end of the sample is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(sample)
+        return Encoding('utf-8')
+    except UnicodeDecodeError:
+        # every byte is a character in Latin-1, so it can open any file
+        return Encoding('latin-1')
+
+def detect_encoding(path):
+    with open(path, 'rb') as sample_file:
+        encoding = guess_encoding(sample_file.read(SAMPLE_SIZE))
+        size = os.fstat(sample_file.fileno()).st_size
+    if (size - len(encoding.bom)) % UNIT_SIZES.get(encoding.name, 1):
+        # a file that ends part way through a code unit can't be decoded, so it is read byte for byte
+        return Encoding('latin-1')
+    return encoding
+
+def read_file(path, encoding):
+    """
+    Reads a file and decodes it a chunk at a time, so that the whole file is never held as bytes and text at once.
+    Line endings are translated to \\n in the same way as a file opened as text.
+    """
+    decoder = io.IncrementalNewlineDecoder(encoding.get_decoder(), translate = True)
+    parts = []
+    with open(path, 'rb') as text_file:
+        text_file.seek(len(encoding.bom))
+        while chunk := text_file.read(DECODE_CHUNK):
+            parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode(b'', final = True))
+    return ''.join(parts)
+
+def read_text(path, encoding):
+    """Reads a file with read_file. Returns (text, encoding), which is Latin-1 if the file is not valid in encoding"""
+    try:
+        return (read_file(path, encoding), encoding)
+    except UnicodeDecodeError:
+        # every file can be read byte for byte, which is saved back unchanged
+        encoding = Encoding('latin-1')
+        return (read_file(path, encoding), encoding)
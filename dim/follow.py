@@ -0,0 +1,46 @@
+import io
+import os
+
+# most bytes read from a followed file each time it is polled, so that a burst of output doesn't hold up the screen
+FOLLOW_READ_LIMIT = 4 * 1024 * 1024
+
+class FileFollower:
+    """
+    Watches a file that is still being written to, such as a log, for text added to its end.
+    Each poll only reads the bytes added since the last one. A character or line ending split
+    between two polls is held back by the decoder until the rest of it arrives.
+    If the file is truncated or replaced, as when a log is rotated, it is read again from the start.
+    """
+    def __init__(self, path, encoding, pos):
+        """Follows a file in some Encoding, of which the first pos bytes have already been read"""
+        self.path = path
+        self.encoding = encoding
+        self.pos = pos
+        self.inode = os.stat(path).st_ino
+        self.decoder = io.IncrementalNewlineDecoder(encoding.get_decoder(), translate = True)
+
+    def poll(self):
+        """
+        Returns (text, restarted), where text was added to the file since the last poll.
+        restarted is whether the file was truncated or replaced, in which case text is from its start.
+        """
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            # a rotated log may not have been created again yet
+            return ('', False)
+        restarted = info.st_ino != self.inode or info.st_size < self.pos
+        if restarted:
+            self.inode = info.st_ino
+            self.pos = 0
+            self.decoder.reset()
+        if info.st_size == self.pos:
+            return ('', restarted)
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(self.pos)
+            data = log_file.read(min(info.st_size - self.pos, FOLLOW_READ_LIMIT))
+        if self.pos == 0 and data.startswith(self.encoding.bom):
+            data = data[len(self.encoding.bom) : ]
+            self.pos += len(self.encoding.bom)
+        self.pos += len(data)
+        return (self.decoder.decode(data), restarted)
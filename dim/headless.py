@@ -0,0 +1,188 @@
+import curses
+from collections import deque
+
+from width import char_width, is_plain
+
+class OutOfKeys(Exception):
+    """Raised when the editor waits for a key and none are left to replay"""
+
+class HeadlessWindow:
+    """
+    A window of a HeadlessScreen, which implements the curses window calls the editor makes.
+    Text is written to the characters of the screen, and colors are kept as curses attributes.
+    """
+    def __init__(self, screen, top, left, height, width):
+        self.screen = screen
+        self.top = top
+        self.left = left
+        self.height = height
+        self.width = width
+        self.y, self.x = (0, 0)
+        self.delay = -1 # milliseconds getkey waits for, where -1 waits forever
+
+    def getmaxyx(self):
+        return (self.height, self.width)
+
+    def derwin(self, height, width, top, left):
+        return HeadlessWindow(self.screen, self.top + top, self.left + left, height, width)
+
+    def keypad(self, flag):
+        pass
+
+    def bkgd(self, char, attr = 0):
+        pass
+
+    def noutrefresh(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def move(self, y, x):
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            raise curses.error('move() returned ERR')
+        self.y, self.x = (y, x)
+        self.screen.cursor = (self.top + y, self.left + x)
+
+    def fill(self, y, x, text, attr):
+        """Writes text on row y from column x, cutting it off at the edge of the window"""
+        row = self.top + y
+        if is_plain(text):
+            text = text[ : self.width - x]
+            self.screen.chars[row][self.left + x : self.left + x + len(text)] = text
+            self.screen.attrs[row][self.left + x : self.left + x + len(text)] = [attr] * len(text)
+            return
+        for char in text:
+            width = char_width(char)
+            if x + width > self.width:
+                return
+            self.put(row, x, char, width, attr)
+            x += width
+
+    def put(self, row, x, char, width, attr):
+        """Writes a character to a cell, or to two cells if it is wide"""
+        chars, attrs = (self.screen.chars[row], self.screen.attrs[row])
+        if width == 0:
+            # combining marks are drawn in the cell of the character before them
+            if x > 0:
+                chars[self.left + x - 1] += char
+            return
+        chars[self.left + x] = char
+        attrs[self.left + x] = attr
+        if width == 2:
+            # the second cell of a wide character holds nothing
+            chars[self.left + x + 1] = ''
+            attrs[self.left + x + 1] = attr
+
+    def erase(self):
+        for y in range(self.height):
+            self.fill(y, 0, ' ' * self.width, 0)
+        self.move(0, 0)
+
+    def clrtoeol(self):
+        self.fill(self.y, self.x, ' ' * (self.width - self.x), 0)
+
+    def addstr(self, *args):
+        """Writes text at the cursor, or at (y, x) if they are given first"""
+        if len(args) >= 3:
+            self.move(args[0], args[1])
+            args = args[2 : ]
+        text, attr = (args[0], args[1] if len(args) > 1 else 0)
+        for index, part in enumerate(text.split('\n')):
+            if index > 0:
+                self.clrtoeol()
+                self.y, self.x = (self.y + 1, 0)
+            if is_plain(part):
+                while part:
+                    if self.y >= self.height:
+                        raise curses.error('addstr() returned ERR')
+                    self.fill(self.y, self.x, part, attr)
+                    count = min(len(part), self.width - self.x)
+                    part = part[count : ]
+                    self.x += count
+                    if self.x == self.width:
+                        self.y, self.x = (self.y + 1, 0)
+                continue
+            for char in part:
+                width = char_width(char)
+                if self.x + width > self.width:
+                    # a wide character that doesn't fit goes to the start of the next row
+                    self.y, self.x = (self.y + 1, 0)
+                if self.y >= self.height:
+                    raise curses.error('addstr() returned ERR')
+                self.put(self.top + self.y, self.x, char, width, attr)
+                self.x += width
+                if self.x == self.width:
+                    self.y, self.x = (self.y + 1, 0)
+
+    def chgat(self, y, x, count, attr):
+        count = max(0, min(count, self.width - x))
+        self.screen.attrs[self.top + y][self.left + x : self.left + x + count] = [attr] * count
+
+    def timeout(self, delay):
+        self.delay = delay
+
+    def nodelay(self, flag):
+        self.delay = 0 if flag else -1
+
+    def getkey(self):
+        return self.screen.next_key(self.delay)
+
+    def get_wch(self):
+        return self.screen.next_key(self.delay)
+
+class HeadlessScreen(HeadlessWindow):
+    """
+    A stand-in for stdscr that draws to memory and reads keys from a queue instead of a terminal,
+    so that the editor can be driven by a script without a real terminal.
+    Keys are given the way curses returns them, such as 'a', '\\n', '\\x1b' or 'KEY_UP'.
+    """
+    def __init__(self, height = 24, width = 80, keys = ()):
+        self.chars = [[' '] * width for _ in range(height)]
+        self.attrs = [[0] * width for _ in range(height)]
+        self.keys = deque(keys)
+        self.cursor = (0, 0)
+        super().__init__(self, 0, 0, height, width)
+
+    def send(self, keys):
+        """Queues keys to be read by the editor"""
+        self.keys.extend(keys)
+
+    def next_key(self, delay):
+        if self.keys:
+            return self.keys.popleft()
+        if delay < 0:
+            raise OutOfKeys()
+        raise curses.error('no input')
+
+    def get_lines(self):
+        """Returns the text on the screen, one string per row"""
+        return [''.join(row) for row in self.chars]
+
+    # the calls the editor makes outside of a window, which a Terminal makes on a real terminal
+
+    def start_color(self):
+        pass
+
+    def use_default_colors(self):
+        pass
+
+    def init_pair(self, pair, fg, bg):
+        pass
+
+    def color_pair(self, pair):
+        # the pair number is kept in the same bits that curses uses
+        return pair << 8
+
+    def doupdate(self):
+        pass
+
+    def ungetch(self, key):
+        self.keys.appendleft(key)
+
+    def unget_wch(self, key):
+        self.keys.appendleft(key)
+
+    def write(self, text):
+        # there is no terminal to turn bracketed paste on for
+        pass
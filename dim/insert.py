@@ -5,8 +5,8 @@ from position import *
 from state import StateManager
 
 class InsertMode(Mode):
-    def __init__(self, buffer, state_manager, caret, file_name, args):
-        super().__init__(buffer, state_manager, caret, file_name, args)
+    def __init__(self, buffer, state_manager, caret, file_name, args, registers):
+        super().__init__(buffer, state_manager, caret, file_name, args, registers)
         self.name = MODE_INSERT
 
     def parse_command(self, command, args = []):
@@ -56,6 +56,12 @@ class InsertMode(Mode):
         elif key == 'KEY_END':
             # go to right
             self.caret.x = self.buffer.get_line_length(self.caret.y)
+        elif key == 'KEY_PASTE':
+            # insert all of the pasted text as one edit
+            offset = self.buffer.get_offset(self.caret)
+            self.buffer.insert(self.caret.y, self.caret.x, key.text)
+            self.caret = self.buffer.get_position(offset + len(key.text))
+            self.push_state()
         elif ischar(key):
             # allowed text characters
             self.buffer.insert(self.caret.y, self.caret.x, key)
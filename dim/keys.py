@@ -1,3 +1,10 @@
+# terminal sequences that turn bracketed paste on and off
+BRACKETED_PASTE_ON = '\x1b[?2004h'
+BRACKETED_PASTE_OFF = '\x1b[?2004l'
+# sequences that surround pasted text when bracketed paste is on
+PASTE_START = '\x1b[200~'
+PASTE_END = '\x1b[201~'
+
 KEYDICT = {
     # escape
     chr(27): 'KEY_ESCAPE',
@@ -42,3 +49,12 @@ def normalizekey(key):
 
 def ischar(key):
     return type(key) == str and key.isprintable() and len(key) == 1
+
+
+class PasteKey(str):
+    """The key name KEY_PASTE, carrying the pasted text in its text attribute"""
+    def __new__(cls, text):
+        key = super().__new__(cls, 'KEY_PASTE')
+        # terminals may send line breaks as carriage returns
+        key.text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return key
@@ -0,0 +1,65 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# stages of handling a key that are timed, in the order they are shown
+STAGES = ['get_key', 'parse_key', 'push_state', 'scroll_screen', 'flush']
+# number of recent times per stage that the percentiles in the header are taken from
+ROLLING_WINDOW = 200
+# upper bounds in milliseconds of the buckets of the histograms, the last of which holds everything slower
+HISTOGRAM_BOUNDS = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+def measure(stats, stage):
+    """Returns a context that times a stage if stats is not None"""
+    return stats.measure(stage) if stats is not None else nullcontext()
+
+class LatencyStats:
+    """
+    Times the stages of handling each key in debug mode.
+    Recent times are kept for the percentiles shown in the header, and every time
+    is counted in a histogram that can be printed when the editor exits.
+    """
+    def __init__(self):
+        self.recent = {stage: deque(maxlen = ROLLING_WINDOW) for stage in STAGES}
+        self.counts = {stage: [0] * (len(HISTOGRAM_BOUNDS) + 1) for stage in STAGES}
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - start) * 1000)
+
+    def add(self, stage, elapsed):
+        """Records that a stage took elapsed milliseconds"""
+        self.recent[stage].append(elapsed)
+        self.counts[stage][bisect_left(HISTOGRAM_BOUNDS, elapsed)] += 1
+
+    def get_percentile(self, stage, fraction):
+        times = sorted(self.recent[stage])
+        return times[min(len(times) - 1, int(len(times) * fraction))] if times else 0
+
+    def get_summary(self):
+        """Returns the p50/p99 of the recent times of each stage, in milliseconds"""
+        return ' '.join([
+            f'{stage.split("_")[0]} {self.get_percentile(stage, 0.5):.1f}/{self.get_percentile(stage, 0.99):.1f}'
+            for stage in STAGES if self.recent[stage]
+        ])
+
+    def get_histogram(self):
+        """Returns the lines of a histogram of every time recorded for each stage"""
+        lines = []
+        labels = [f'<= {bound} ms' for bound in HISTOGRAM_BOUNDS] + [f'> {HISTOGRAM_BOUNDS[-1]} ms']
+        for stage in STAGES:
+            counts = self.counts[stage]
+            total = sum(counts)
+            if total == 0:
+                continue
+            lines.append(f'{stage} ({total} times, p50 {self.get_percentile(stage, 0.5):.2f} ms, p99 {self.get_percentile(stage, 0.99):.2f} ms recently)')
+            # buckets after the slowest time are left out
+            last = max([index for index, count in enumerate(counts) if count])
+            for label, count in list(zip(labels, counts))[ : last + 1]:
+                lines.append(f'  {label:>12} {count:>8} {"#" * round(count / total * 50)}')
+        return lines
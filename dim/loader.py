@@ -0,0 +1,140 @@
+import mmap
+import threading
+from collections import OrderedDict
+
+from encoding import Encoding
+from rope import Source
+
+# files larger than this many bytes are memory mapped and loaded lazily
+LAZY_LOAD_LIMIT = 16 * 1024 * 1024
+# approximate number of bytes in each chunk of a mapped file
+CHUNK_SIZE = 1024 * 1024
+# number of decoded chunks kept in memory
+DECODED_CHUNKS = 8
+
+class ChunkSource:
+    """
+    A run of whole lines of a mapped file, used by pieces in the same way as a Source.
+    The text is only decoded when it is needed, and the decoded text may be dropped
+    again at any time, so untouched parts of the file never take up memory.
+    """
+    __slots__ = ('loader', 'start', 'end', 'chars', 'lines')
+
+    def __init__(self, loader, start, end, chars, lines):
+        self.loader = loader
+        self.start = start
+        self.end = end
+        self.chars = chars
+        self.lines = lines
+
+    def source(self):
+        return self.loader.decoded(self)
+
+    def count(self, start, end):
+        return self.source().count(start, end)
+
+    def find(self, start, k):
+        return self.source().find(start, k)
+
+    def slice(self, start, end):
+        return self.source().slice(start, end)
+
+class FileLoader:
+    """
+    Memory maps a file and splits it into chunks on a background thread.
+    The first chunk is read before the constructor returns so that the first
+    screen can be shown right away. Chunks found since the last call are
+    returned by take(). Each chunk is decoded on its own, so chunks end after
+    a newline in the encoding of the file, which is never inside a character.
+    """
+    def __init__(self, path, encoding = None):
+        self.encoding = encoding if encoding is not None else Encoding('utf-8')
+        with open(path, 'rb') as edit_file:
+            self.map = mmap.mmap(edit_file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.size = len(self.map)
+        self.chunks = []
+        self.taken = 0
+        # the text starts after the byte order mark
+        self.text_start = len(self.encoding.bom)
+        self.pos = self.text_start
+        self.error = None
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.scan_chunk()
+        self.thread = threading.Thread(target = self.scan, daemon = True)
+        self.thread.start()
+
+    def scan_chunk(self):
+        """Finds the end of the next chunk and counts its characters and lines"""
+        start = self.pos
+        if start + CHUNK_SIZE >= self.size:
+            end = self.size
+        else:
+            # chunks end after a newline so that no line or character is split between chunks
+            end = self.rfind_newline(start, start + CHUNK_SIZE)
+            if end == 0:
+                # a line longer than the chunk size
+                end = self.find_newline(start + CHUNK_SIZE) or self.size
+        text = self.decode(start, end)
+        self.chunks.append(ChunkSource(self, start, end, len(text), text.count('\n')))
+        self.pos = end
+
+    def decode(self, start, end):
+        """Decodes part of the file, translating line endings to \\n in the same way as read_file"""
+        text = self.encoding.decode(self.map[start : end])
+        if '\r' in text:
+            # chunks end after a newline, so a \r\n is never split between two of them
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def is_aligned(self, pos):
+        """Checks whether pos is at the start of a code unit, where newlines are longer than a byte"""
+        return (pos - self.text_start) % len(self.encoding.newline) == 0
+
+    def rfind_newline(self, start, end):
+        """Returns the offset just after the last newline between start and end, or 0 if there is none"""
+        newline = self.encoding.newline
+        pos = self.map.rfind(newline, start, end)
+        while pos != -1 and not self.is_aligned(pos):
+            pos = self.map.rfind(newline, start, pos + len(newline) - 1)
+        return pos + len(newline) if pos != -1 else 0
+
+    def find_newline(self, start):
+        """Returns the offset just after the first newline after start, or 0 if there is none"""
+        newline = self.encoding.newline
+        pos = self.map.find(newline, start)
+        while pos != -1 and not self.is_aligned(pos):
+            pos = self.map.find(newline, pos + 1)
+        return pos + len(newline) if pos != -1 else 0
+
+    def scan(self):
+        try:
+            while self.pos < self.size:
+                self.scan_chunk()
+        except UnicodeDecodeError as e:
+            self.error = e
+
+    def is_done(self):
+        return not self.thread.is_alive() and self.taken == len(self.chunks)
+
+    def wait(self):
+        """Waits for the whole file to be scanned"""
+        self.thread.join()
+
+    def take(self):
+        chunks = self.chunks[self.taken : ]
+        self.taken += len(chunks)
+        return chunks
+
+    def decoded(self, chunk):
+        """Returns the decoded text of a chunk, keeping the most recently used chunks cached"""
+        with self.lock:
+            src = self.cache.get(chunk)
+            if src is not None:
+                self.cache.move_to_end(chunk)
+                return src
+            src = Source(self.decode(chunk.start, chunk.end))
+            self.cache[chunk] = src
+            if len(self.cache) > DECODED_CHUNKS:
+                self.cache.popitem(last = False)
+            return src
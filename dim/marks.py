@@ -0,0 +1,110 @@
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from operator import add
+
+# names of the marks that the editor sets itself
+SELECT_START = '<' # start of the current or last selection
+SELECT_END = '>' # end of the current or last selection
+SEARCH_HIT = '/' # last match that was gone to
+
+class MarkIndex:
+    """
+    Named offsets into the text which move with the text around them as it is edited.
+    Offsets are kept sorted in an array, along with a Fenwick tree of the shifts that edits
+    have made to every mark from some rank onwards. An edit adds one shift and moves the
+    marks inside the text it replaced, so it takes O(log^2 m + k) for m marks, of which k
+    were replaced. Adding a mark, or moving one past another, rebuilds the arrays.
+    """
+    def __init__(self):
+        self.offsets = array('q') # offsets of the marks when the shifts were last cleared
+        self.shifts = array('q', [0]) # Fenwick tree of shifts, indexed from 1
+        self.names = [] # name of the mark at each rank
+        self.ranks = {} # rank of each name
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_shift(self, rank, delta):
+        """Shifts the marks from rank onwards by delta"""
+        index = rank + 1
+        while index < len(self.shifts):
+            self.shifts[index] += delta
+            index += index & -index
+
+    def get_at(self, rank):
+        """Returns the offset of the mark at rank"""
+        offset = self.offsets[rank]
+        index = rank + 1
+        while index > 0:
+            offset += self.shifts[index]
+            index -= index & -index
+        return offset
+
+    def get_offsets(self):
+        """Returns the offset of every mark in order"""
+        # turn the tree back into the shift added at each rank, then add them up
+        shifts = self.shifts.tolist()
+        for index in range(len(shifts) - 1, 0, -1):
+            parent = index + (index & -index)
+            if parent < len(shifts):
+                shifts[parent] -= shifts[index]
+        return list(map(add, self.offsets, accumulate(shifts[1 : ])))
+
+    def find(self, offset):
+        """Returns the rank of the first mark at or after offset"""
+        lo, hi = (0, len(self.names))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_at(mid) < offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, name):
+        """Returns the offset of a mark, or None if it is not set"""
+        rank = self.ranks.get(name)
+        return self.get_at(rank) if rank is not None else None
+
+    def set(self, name, offset):
+        rank = self.ranks.get(name)
+        if rank is not None:
+            # a mark that stays between its neighbours is moved in place
+            if (rank == 0 or self.get_at(rank - 1) <= offset) and (rank + 1 == len(self) or offset <= self.get_at(rank + 1)):
+                delta = offset - self.get_at(rank)
+                self.add_shift(rank, delta)
+                self.add_shift(rank + 1, -delta)
+                return
+        marks = [mark for mark in zip(self.get_offsets(), self.names) if mark[1] != name]
+        marks.insert(bisect_left([mark_offset for mark_offset, _ in marks], offset), (offset, name))
+        self.rebuild(marks)
+
+    def remove(self, name):
+        if name in self.ranks:
+            self.rebuild([mark for mark in zip(self.get_offsets(), self.names) if mark[1] != name])
+
+    def rebuild(self, marks):
+        """Stores a sorted list of (offset, name) marks with no shifts"""
+        self.offsets = array('q', [offset for offset, _ in marks])
+        self.shifts = array('q', [0]) * (len(marks) + 1)
+        self.names = [name for _, name in marks]
+        self.ranks = {name: rank for rank, name in enumerate(self.names)}
+
+    def reset(self):
+        self.rebuild([])
+
+    def edited(self, offset, removed, inserted):
+        """Moves the marks after the text at offset was replaced"""
+        if not self.names:
+            return
+        end = offset + removed
+        first = self.find(offset)
+        last = self.find(end) if removed else first
+        # marks in the removed text move to its start
+        for rank in range(first, last):
+            delta = offset - self.get_at(rank)
+            self.add_shift(rank, delta)
+            self.add_shift(rank + 1, -delta)
+        if inserted != removed:
+            self.add_shift(last, inserted - removed)
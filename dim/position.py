@@ -1,44 +1,48 @@
 class Position:
+    __slots__ = ('y', 'x')
+
     def __init__(self, y, x):
         self.y = y
         self.x = x
 
     def move_left(self, buffer, spaces = 1):
-        grid = buffer.get_lines()
-        self.x -= spaces
-        if self.x >= 0:
-            return
-        while self.x < 0 and self.y > 0:
-            self.y -= 1
-            self.x += max(1, len(grid[self.y]))
-        if self.y < 0 or self.x < 0:
-            self.y = self.x = 0
-        else:
-            self.x += min(1, len(grid[self.y]))
+        """Moves back by some number of characters, where each line break counts as one character"""
+        pos = buffer.get_position(buffer.get_offset(self) - spaces)
+        self.y, self.x = pos.y, pos.x
 
     def move_right(self, buffer, spaces = 1):
-        grid = buffer.get_lines()
-        self.x += spaces
-        if self.x <= len(grid[self.y]):
-            return
-        while self.y < len(grid) - 1 and spaces > 0:
-            self.y += 1
-            spaces -= max(1, len(grid[self.y]))
-        if self.y >= len(grid):
-            self.y = len(grid) - 1
-            self.x = len(grid[self.y])
-        else:
-            self.x = max(0, spaces + len(grid[self.y]) - 1)
+        """Moves forward by some number of characters, where each line break counts as one character"""
+        pos = buffer.get_position(buffer.get_offset(self) + spaces)
+        self.y, self.x = pos.y, pos.x
 
     def move_up(self, buffer, spaces = 1):
-        grid = buffer.get_lines()
-        self.y = max(self.y - spaces, 0)
-        self.x = min(len(grid[self.y]), self.x)
+        if buffer.wrap is not None:
+            self.move_rows(buffer, spaces, buffer.wrap.prev_row)
+            return
+        self.move_to_column(buffer, max(self.y - spaces, 0), buffer.layouts.get_column(self))
 
     def move_down(self, buffer, spaces = 1):
-        grid = buffer.get_lines()
-        self.y = min(self.y + spaces, len(grid) - 1)
-        self.x = min(len(grid[self.y]), self.x)
+        if buffer.wrap is not None:
+            self.move_rows(buffer, spaces, buffer.wrap.next_row)
+            return
+        self.move_to_column(buffer, min(self.y + spaces, buffer.get_text_height() - 1), buffer.layouts.get_column(self))
+
+    def move_rows(self, buffer, spaces, step):
+        """Moves by some number of screen rows when long lines are wrapped, keeping the column on the screen"""
+        width = buffer.wrap.width
+        row = buffer.wrap.get_row(self)
+        column = buffer.layouts.get_column(self) % width
+        for _ in range(spaces):
+            next_row = step(row)
+            if next_row is None:
+                break
+            row = next_row
+        self.move_to_column(buffer, row[0], row[1] * width + column)
+
+    def move_to_column(self, buffer, y, column):
+        """Moves to the character of line y that is drawn in a column, or to the end of the line"""
+        self.y = y
+        self.x = min(buffer.get_line_length(y), buffer.layouts.get(y).get_index(column))
 
     def is_before(self, other):
         return self < other
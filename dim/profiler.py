@@ -0,0 +1,67 @@
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+
+# seconds between samples of the stack of the main thread
+SAMPLE_INTERVAL = 0.005
+
+def get_frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+class SessionProfiler:
+    """
+    Profiles an editing session with cProfile, and optionally samples the stack of the
+    main thread on a background thread to write collapsed stacks for a flame graph.
+    cProfile adds work to every Python call, so --profile slows down handling keys, drawing and
+    searching, and the latencies shown in the header are higher than without it.
+    The stack sampler only wakes every few milliseconds, so --profile-stacks is cheap enough
+    to leave on while editing normally.
+    """
+    def __init__(self, stats_path = None, stacks_path = None):
+        self.stats_path = stats_path
+        self.stacks_path = stacks_path
+        self.profile = cProfile.Profile() if stats_path is not None else None
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.stacks_path is not None:
+            self.thread = threading.Thread(target = self.sample, args = (threading.get_ident(), ), daemon = True)
+            self.thread.start()
+        if self.profile is not None:
+            self.profile.enable()
+
+    def sample(self, thread_id):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                names.append(get_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        """Stops profiling and writes the results. Returns a list of messages about where they were written"""
+        if self.profile is not None:
+            self.profile.disable()
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        messages = []
+        try:
+            if self.profile is not None:
+                self.profile.dump_stats(self.stats_path)
+                messages.append(f'Wrote the profile to {self.stats_path}.')
+            if self.stacks_path is not None:
+                with open(self.stacks_path, 'w') as stacks_file:
+                    for stack, count in self.stacks.most_common():
+                        stacks_file.write(f'{stack} {count}\n')
+                messages.append(f'Wrote {sum(self.stacks.values())} stack samples to {self.stacks_path}.')
+        except OSError as e:
+            messages.append(f'The profile could not be written: {e}')
+        return messages
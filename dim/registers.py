@@ -0,0 +1,71 @@
+from itertools import chain, repeat
+
+# macros that replay other macros can only be nested this deep, which stops a macro that replays itself
+MAX_MACRO_DEPTH = 100
+
+class Registers:
+    """
+    Named registers shared by the modes, which hold yanked text and macros of recorded keys.
+    Yanked text is kept as a table that shares the pieces of the buffer, so yanking copies nothing.
+    While a macro is recorded, every key typed is added to it. Replaying a macro queues
+    its keys, which the editor then handles as if they were typed.
+    """
+    def __init__(self):
+        self.texts = {} # text yanked into each register, where None is the unnamed register
+        self.macros = {} # keys recorded into each register
+        self.recording = None # register being recorded into
+        self.keys = [] # keys recorded so far
+        self.command_start = 0 # number of recorded keys before the command being typed
+        self.last_macro = None
+        self.replaying = [] # iterators over the keys left to replay, innermost macro last
+
+    def yank(self, name, table):
+        """Stores a table of text in a register, and in the unnamed register"""
+        self.texts[name] = table
+        self.texts[None] = table
+
+    def get_text(self, name):
+        """Returns the text in a register, or None if nothing was yanked into it"""
+        table = self.texts.get(name)
+        return table.text() if table is not None else None
+
+    def start_recording(self, name):
+        self.recording = name
+        self.keys = []
+        self.command_start = 0
+
+    def stop_recording(self):
+        """Saves the recorded keys, except for the ones that typed the command to stop"""
+        self.macros[self.recording] = self.keys[ : self.command_start]
+        self.last_macro = self.recording
+        self.recording = None
+        self.keys = []
+
+    def record(self, key, starts_command):
+        """Records a typed key. starts_command is whether no command was being typed before it"""
+        if self.recording is None:
+            return
+        if starts_command:
+            self.command_start = len(self.keys)
+        self.keys.append(key)
+
+    def replay(self, name, count = 1):
+        """Queues the keys of a macro count times. Returns an error message, or None if it was queued"""
+        if name is None:
+            name = self.last_macro
+        if name not in self.macros:
+            return f'No macro is recorded in {name}' if name is not None else 'No macro has been recorded'
+        if len(self.replaying) >= MAX_MACRO_DEPTH:
+            return f'Macros are nested more than {MAX_MACRO_DEPTH} deep'
+        self.last_macro = name
+        self.replaying.append(chain.from_iterable(repeat(self.macros[name], count)))
+        return None
+
+    def next_key(self):
+        """Returns the next key to replay, or None once every queued macro is finished"""
+        while self.replaying:
+            key = next(self.replaying[-1], None)
+            if key is not None:
+                return key
+            self.replaying.pop()
+        return None
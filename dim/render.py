@@ -0,0 +1,179 @@
+from curses import *
+
+from position import *
+
+PADCHAR = ' '
+PAD_LEN = len(PADCHAR)
+HEADER_LEN = 2
+
+class Renderer:
+    """
+    Draws the buffer into two windows, one for the header and one for the text.
+    Only the rows that changed since the last frame are redrawn. Rows are marked
+    as changed by edits, selection changes and scrolling.
+    """
+    def __init__(self, stdscr, terminal):
+        self.stdscr = stdscr
+        self.terminal = terminal
+        self.header_win = None
+        self.text_win = None
+        self.size = None
+        self.invalidate()
+
+    def invalidate(self):
+        """Forces the next frame to redraw everything"""
+        self.full = True
+        self.last_header = None
+        self.last_topleft = None
+        self.last_selection = (None, None)
+        self.dirty_lines = set()
+        self.dirty_from = None # every line from this index onwards has changed
+
+    def mark_line(self, y):
+        self.dirty_lines.add(y)
+
+    def mark_lines_from(self, y):
+        if self.dirty_from is None or y < self.dirty_from:
+            self.dirty_from = y
+
+    def mark_range(self, y1, y2):
+        """Marks the lines from y1 to y2 [inclusive, inclusive] as changed"""
+        y1, y2 = min(y1, y2), max(y1, y2)
+        if self.last_topleft is not None:
+            # lines off the screen are drawn anyway when they scroll into view
+            y1 = max(y1, self.last_topleft.y)
+            y2 = min(y2, self.last_topleft.y + self.size[0] - HEADER_LEN)
+        self.dirty_lines.update(range(y1, y2 + 1))
+
+    def is_dirty(self, y):
+        return self.full or y in self.dirty_lines or (self.dirty_from is not None and y >= self.dirty_from)
+
+    def make_windows(self):
+        height, width = self.stdscr.getmaxyx()
+        if self.size == (height, width) and self.text_win is not None:
+            return
+        self.size = (height, width)
+        self.header_win = self.stdscr.derwin(HEADER_LEN, width, 0, 0)
+        self.text_win = self.stdscr.derwin(height - HEADER_LEN, width, HEADER_LEN, 0)
+        self.text_win.keypad(True)
+        self.invalidate()
+
+    def mark_selection(self, select_start_pos, select_end_pos):
+        """Marks the lines whose highlighting changed since the last frame"""
+        old_start, old_end = self.last_selection
+        if old_start is None and select_start_pos is None:
+            return
+        if old_start is None or select_start_pos is None:
+            start, end = (select_start_pos, select_end_pos) if old_start is None else (old_start, old_end)
+            self.mark_range(start.y, end.y)
+        else:
+            if old_start != select_start_pos:
+                self.mark_range(old_start.y, select_start_pos.y)
+            if old_end != select_end_pos:
+                self.mark_range(old_end.y, select_end_pos.y)
+        self.last_selection = (
+            select_start_pos.copy() if select_start_pos is not None else None,
+            select_end_pos.copy() if select_end_pos is not None else None
+        )
+
+    def draw_header(self, header):
+        self.header_win.erase()
+        try:
+            for text, color in header:
+                self.header_win.addstr(text, self.terminal.color_pair(color))
+        except error:
+            # writing the bottom right corner of a window moves the cursor out of it
+            pass
+        self.last_header = header
+
+    def get_selected(self, y, select_start_pos, select_end_pos):
+        """Returns the characters of line y that are selected [inclusive, exclusive)"""
+        if select_start_pos is None or not select_start_pos.y <= y <= select_end_pos.y:
+            return (0, 0)
+        return (
+            select_start_pos.x if select_start_pos.y == y else 0,
+            select_end_pos.x + 1 if select_end_pos.y == y else float('inf')
+        )
+
+    def draw_colors(self, row, colors, layout, column, width, selected):
+        """Colors spans of a row, except where they are selected"""
+        selected = [layout.get_column(x) for x in selected]
+        for x1, x2, color in colors:
+            x1 = max(layout.get_column(x1), column)
+            x2 = min(layout.get_column(x2), column + width)
+            for part_x1, part_x2 in [(x1, min(x2, selected[0])), (max(x1, selected[1]), x2)]:
+                if part_x1 < part_x2:
+                    self.text_win.chgat(row, part_x1 - column + PAD_LEN, part_x2 - part_x1, self.terminal.color_pair(color))
+
+    def draw_line(self, row, line, layout, column, width, selected):
+        """Draws the columns of a line from column that fit in width, highlighting the selected characters"""
+        win = self.text_win
+        win.move(row, 0)
+        win.clrtoeol()
+        win.addstr(PADCHAR)
+        end = column + width
+        selected = [min(max(layout.get_column(x), column), end) for x in selected]
+        win.addstr(layout.get_text(line, column, selected[0]))
+        if selected[1] > selected[0]:
+            win.addstr(layout.get_text(line, selected[0], selected[1]), self.terminal.color_pair(7))
+        win.addstr(layout.get_text(line, selected[1], end))
+
+    def get_rows(self, buffer, scr_topleft, scr_bottomright, text_height):
+        """Returns the line and first column shown on each row of the screen"""
+        count = min(self.size[0] - HEADER_LEN, scr_bottomright.y - scr_topleft.y)
+        if buffer.wrap is None:
+            return [(scr_topleft.y + row, scr_topleft.x) for row in range(count)]
+        width = buffer.wrap.width
+        rows = []
+        # the top left is a line and a column rather than a character
+        row = (scr_topleft.y, scr_topleft.x // width)
+        while row is not None and len(rows) < count:
+            rows.append((row[0], row[1] * width))
+            row = buffer.wrap.next_row(row)
+        # the rows after the end of the text are cleared as if they were lines
+        rows.extend((text_height + row, 0) for row in range(count - len(rows)))
+        return rows
+
+    def render(self, buffer, header, caret, select_start_pos, select_end_pos, scr_topleft, scr_bottomright):
+        self.make_windows()
+        if header != self.last_header:
+            self.draw_header(header)
+            self.header_win.noutrefresh()
+        if self.last_topleft is None or scr_topleft != self.last_topleft:
+            # everything moved
+            self.full = True
+            self.last_topleft = scr_topleft.copy()
+        self.mark_selection(select_start_pos, select_end_pos)
+        text_height = buffer.get_text_height()
+        # the last column is kept for the caret
+        width = buffer.screen_width() - 1
+        rows = self.get_rows(buffer, scr_topleft, scr_bottomright, text_height)
+        for row, (y, column) in enumerate(rows):
+            if not self.is_dirty(y):
+                continue
+            if y < text_height:
+                line = buffer.get_line(y)
+                layout = buffer.layouts.get(y, line)
+                selected = self.get_selected(y, select_start_pos, select_end_pos)
+                self.draw_line(row, line, layout, column, width, selected)
+                colors = buffer.get_line_colors(y, line)
+                if colors:
+                    self.draw_colors(row, colors, layout, column, width, selected)
+            else:
+                self.text_win.move(row, 0)
+                self.text_win.clrtoeol()
+        self.full = False
+        self.dirty_lines.clear()
+        self.dirty_from = None
+        column = buffer.layouts.get_column(caret)
+        if buffer.wrap is not None:
+            caret_row = (caret.y, column // buffer.wrap.width * buffer.wrap.width)
+            if caret_row in rows:
+                self.text_win.move(rows.index(caret_row), column - caret_row[1] + PAD_LEN)
+            else:
+                # scrolling keeps the caret on the screen, but it is better left out than crash
+                self.text_win.move(0, PAD_LEN)
+        else:
+            self.text_win.move(caret.y - scr_topleft.y, column - scr_topleft.x + PAD_LEN)
+        self.text_win.noutrefresh()
+        self.terminal.doupdate()
@@ -0,0 +1,247 @@
+import random
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+# sources longer than this get an index of their newlines
+INDEX_THRESHOLD = 4096
+# typed text is merged into the previous piece while it stays shorter than this
+COALESCE_LIMIT = 64
+
+class Source:
+    """
+    An immutable string that pieces point into.
+    Large sources keep a sorted array of the positions just after each newline,
+    so that counting and finding newlines inside a piece is a binary search.
+    """
+    __slots__ = ('text', 'breaks')
+
+    def __init__(self, text):
+        self.text = text
+        self.breaks = None
+        if len(text) > INDEX_THRESHOLD:
+            lengths = map((1).__add__, map(len, text.split('\n')[ : -1]))
+            self.breaks = array('q', accumulate(lengths))
+
+    def count(self, start, end):
+        """Counts the newlines in text[start : end]"""
+        if self.breaks is None:
+            return self.text.count('\n', start, end)
+        return bisect_left(self.breaks, end + 1) - bisect_left(self.breaks, start + 1)
+
+    def find(self, start, k):
+        """Returns the index of the k-th (1-indexed) newline at or after start"""
+        if self.breaks is None:
+            pos = start - 1
+            for _ in range(k):
+                pos = self.text.index('\n', pos + 1)
+            return pos
+        return self.breaks[bisect_left(self.breaks, start + 1) + k - 1] - 1
+
+    def slice(self, start, end):
+        return self.text[start : end]
+
+class Node:
+    """
+    A node of the piece tree. Nodes are never modified after they are created,
+    so every version of the tree stays valid and can be kept as a snapshot.
+    """
+    __slots__ = ('src', 'start', 'end', 'nl', 'prio', 'left', 'right', 'size', 'lines')
+
+    def __init__(self, src, start, end, nl, prio, left, right):
+        self.src = src
+        self.start = start
+        self.end = end
+        self.nl = nl
+        self.prio = prio
+        self.left = left
+        self.right = right
+        # subtree totals
+        self.size = end - start
+        self.lines = nl
+        if left is not None:
+            self.size += left.size
+            self.lines += left.lines
+        if right is not None:
+            self.size += right.size
+            self.lines += right.lines
+
+    def with_children(self, left, right):
+        return Node(self.src, self.start, self.end, self.nl, self.prio, left, right)
+
+def leaf(src, start, end, nl = None):
+    if nl is None:
+        nl = src.count(start, end)
+    return Node(src, start, end, nl, random.random(), None, None)
+
+def merge(a, b):
+    """Concatenates two trees"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        return a.with_children(a.left, merge(a.right, b))
+    return b.with_children(merge(a, b.left), b.right)
+
+def split(node, k):
+    """Splits a tree into the first k characters and the rest"""
+    if node is None:
+        return (None, None)
+    left_size = node.left.size if node.left is not None else 0
+    if k <= left_size:
+        a, b = split(node.left, k)
+        return (a, node.with_children(b, node.right))
+    k -= left_size
+    length = node.end - node.start
+    if k >= length:
+        a, b = split(node.right, k - length)
+        return (node.with_children(node.left, a), b)
+    # the split point is inside this piece
+    mid = node.start + k
+    first_nl = node.src.count(node.start, mid)
+    first = leaf(node.src, node.start, mid, first_nl)
+    second = leaf(node.src, mid, node.end, node.nl - first_nl)
+    return (merge(node.left, first), merge(second, node.right))
+
+def last_piece(node):
+    while node.right is not None:
+        node = node.right
+    return node
+
+class PieceTable:
+    """
+    An immutable piece table stored as a balanced tree (treap) of pieces.
+    Each node knows the number of characters and newlines in its subtree,
+    so edits and line lookups are O(log n) in the number of pieces.
+    Edits return a new table and leave the old one untouched.
+    """
+    __slots__ = ('root',)
+
+    def __init__(self, root = None):
+        self.root = root
+
+    @staticmethod
+    def from_text(text):
+        if not text:
+            return PieceTable()
+        src = Source(text)
+        return PieceTable(leaf(src, 0, len(text)))
+
+    def __len__(self):
+        return self.root.size if self.root is not None else 0
+
+    def line_count(self):
+        return (self.root.lines if self.root is not None else 0) + 1
+
+    def line_start(self, y):
+        """Returns the offset of the first character of line y"""
+        if y <= 0:
+            return 0
+        node = self.root
+        offset = 0
+        while node is not None:
+            left_lines = node.left.lines if node.left is not None else 0
+            if y <= left_lines:
+                node = node.left
+                continue
+            y -= left_lines
+            offset += node.left.size if node.left is not None else 0
+            if y <= node.nl:
+                return offset + node.src.find(node.start, y) - node.start + 1
+            y -= node.nl
+            offset += node.end - node.start
+            node = node.right
+        raise IndexError('line index out of range')
+
+    def line_end(self, y):
+        """Returns the offset just after the last character of line y, excluding the newline"""
+        if y + 1 >= self.line_count():
+            return len(self)
+        return self.line_start(y + 1) - 1
+
+    def line_of(self, offset):
+        """Returns the index of the line containing the character at offset"""
+        node = self.root
+        y = 0
+        while node is not None:
+            left_size = node.left.size if node.left is not None else 0
+            if offset < left_size:
+                node = node.left
+                continue
+            offset -= left_size
+            y += node.left.lines if node.left is not None else 0
+            length = node.end - node.start
+            if offset < length:
+                return y + node.src.count(node.start, node.start + offset)
+            offset -= length
+            y += node.nl
+            node = node.right
+        return y
+
+    def pieces(self, start = 0, end = None, max_len = None):
+        """
+        Yields the strings that make up the text from start to end, in order.
+        If max_len is given, long pieces are yielded in parts of at most max_len characters.
+        """
+        if end is None:
+            end = len(self)
+        if end <= start:
+            return
+        stack = []
+        node = self.root
+        offset = 0 # offset of the leftmost character of node's subtree
+        while stack or node is not None:
+            if node is not None:
+                left_size = node.left.size if node.left is not None else 0
+                if offset + left_size > start:
+                    stack.append((node, offset))
+                    node = node.left
+                else:
+                    # left subtree is entirely before start
+                    stack.append((node, offset))
+                    node = None
+                continue
+            node, offset = stack.pop()
+            left_size = node.left.size if node.left is not None else 0
+            piece_start = offset + left_size
+            piece_end = piece_start + node.end - node.start
+            if piece_start >= end:
+                return
+            if piece_end > start:
+                lo = max(start, piece_start) - piece_start + node.start
+                hi = min(end, piece_end) - piece_start + node.start
+                step = max_len or hi - lo
+                for part in range(lo, hi, step):
+                    yield node.src.slice(part, min(part + step, hi))
+            node, offset = node.right, piece_end
+
+    def text(self, start = 0, end = None):
+        return ''.join(self.pieces(start, end))
+
+    def slice(self, start, end):
+        """Returns a table of the text from start to end, which shares the pieces of this one"""
+        _, rest = split(self.root, start)
+        node, _ = split(rest, end - start)
+        return PieceTable(node)
+
+    def insert(self, offset, text):
+        if not text:
+            return self
+        first, second = split(self.root, offset)
+        if first is not None:
+            prev = last_piece(first)
+            length = prev.end - prev.start
+            if length + len(text) <= COALESCE_LIMIT:
+                # merge small insertions into one piece to keep the tree small
+                first, _ = split(first, first.size - length)
+                text = prev.src.slice(prev.start, prev.end) + text
+        src = Source(text)
+        return PieceTable(merge(merge(first, leaf(src, 0, len(text))), second))
+
+    def delete(self, start, end):
+        if end <= start:
+            return self
+        first, rest = split(self.root, start)
+        _, second = split(rest, end - start)
+        return PieceTable(merge(first, second))
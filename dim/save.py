@@ -0,0 +1,130 @@
+import os
+import stat
+import threading
+import time
+
+from encoding import Encoding
+
+# maximum number of characters encoded and written at a time
+WRITE_CHUNK = 1024 * 1024
+# seconds to wait for a save before letting the editor continue while it finishes
+SAVE_WAIT = 0.1
+
+def get_file_mode(path):
+    """Returns the permission bits for the saved file"""
+    if os.path.exists(path):
+        return stat.S_IMODE(os.stat(path).st_mode)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def can_replace(path):
+    """
+    Checks whether a file can be replaced by a new file written next to it, which keeps its owner
+    and group. Otherwise the file is overwritten in place, as it is in a directory that can't be written to.
+    """
+    path = os.path.realpath(path)
+    if not os.access(os.path.dirname(path), os.W_OK | os.X_OK):
+        return False
+    if not os.path.exists(path) or not hasattr(os, 'chown') or os.geteuid() == 0:
+        return True
+    info = os.stat(path)
+    return info.st_uid == os.geteuid() and (info.st_gid == os.getegid() or info.st_gid in os.getgroups())
+
+class Saver:
+    """
+    Writes a snapshot of the text to a file on a background thread.
+    The text is encoded and streamed in chunks to a temporary file in the same directory,
+    which is synced to disk and then renamed over the original file.
+    A crash part way through leaves the original file untouched.
+    A file that can't be replaced is overwritten in place instead.
+    """
+    def __init__(self, table, path, encoding = None):
+        self.table = table
+        # replace the target of a link, not the link itself
+        self.path = os.path.realpath(path)
+        if encoding is None:
+            # imported here so that starting the editor doesn't wait for modules only used when saving
+            import locale
+            encoding = Encoding(locale.getpreferredencoding(False))
+        self.encoding = encoding
+        self.mode = get_file_mode(self.path)
+        self.owner = None # (uid, gid) of the file being replaced
+        if os.path.exists(self.path) and hasattr(os, 'chown'):
+            info = os.stat(self.path)
+            self.owner = (info.st_uid, info.st_gid)
+        self.in_place = not can_replace(self.path)
+        self.total = len(table)
+        self.written = 0
+        self.size = 0 # bytes in the saved file
+        self.error = None
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.thread = threading.Thread(target = self.save)
+        self.thread.start()
+        self.thread.join(SAVE_WAIT)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        temp_path = None
+        try:
+            if self.in_place:
+                self.write(os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), self.mode))
+                return
+            import tempfile
+            fd, temp_path = tempfile.mkstemp(dir = directory, prefix = '.' + os.path.basename(self.path) + '.', suffix = '.tmp')
+            self.write(fd)
+            if self.owner is not None:
+                os.chown(temp_path, *self.owner)
+            os.chmod(temp_path, self.mode)
+            os.replace(temp_path, self.path)
+            temp_path = None
+            self.sync_directory(directory)
+        except Exception as e:
+            self.error = e
+        finally:
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            self.end_time = time.perf_counter()
+
+    def write(self, fd):
+        """Writes the text to a file descriptor and syncs it to disk, then closes it"""
+        with os.fdopen(fd, 'w', encoding = self.encoding.name, errors = self.encoding.errors) as text_file:
+            # the byte order mark is written before the text, and only once
+            text_file.buffer.write(self.encoding.bom)
+            for chunk in self.table.pieces(max_len = WRITE_CHUNK):
+                text_file.write(chunk)
+                self.written += len(chunk)
+            text_file.flush()
+            os.fsync(text_file.fileno())
+            self.size = os.fstat(text_file.fileno()).st_size
+
+    def sync_directory(self, directory):
+        """Makes sure the rename is on disk, on systems that allow opening directories"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def is_done(self):
+        return not self.thread.is_alive()
+
+    def wait(self):
+        self.thread.join()
+
+    def get_status(self):
+        """Returns a message describing the progress of the save"""
+        if not self.is_done():
+            percent = self.written * 100 // max(1, self.total)
+            return f'Saving... {percent}%'
+        if self.error is not None:
+            return f'Save failed: {self.error}'
+        seconds = max(self.end_time - self.start_time, 1e-6)
+        size = self.size / (1024 * 1024)
+        return f'Saved {size:.1f} MB in {seconds:.2f}s ({size / seconds:.1f} MB/s)'
@@ -0,0 +1,354 @@
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+# approximate number of characters scanned at a time, and held by each block of the match index
+SCAN_CHUNK = 64 * 1024
+# texts longer than this many characters are indexed in the background
+BACKGROUND_LIMIT = 1024 * 1024
+# lookarounds, \A and \Z, and $ without multiline can match differently where a line is cut off
+# from the rest of the text, so patterns that may hold them are always scanned a line at a time
+LINE_SENSITIVE = re.compile(r'\(\?<?[=!]|\\[AZ]|\(\?[aiLmsux]*-')
+
+@lru_cache(maxsize = 64)
+def compile_pattern(pattern):
+    """Compiles a search pattern, keeping recently used patterns compiled"""
+    return re.compile(pattern, re.MULTILINE)
+
+def chunk_end(table, start):
+    """Returns the end of the run of whole lines that starts at start and is about SCAN_CHUNK long"""
+    if start + SCAN_CHUNK >= len(table):
+        return len(table)
+    return min(len(table), table.line_end(table.line_of(start + SCAN_CHUNK)) + 1)
+
+def scan_lines(regex, text, pos, end):
+    """Returns the (start, end) offsets in text of the nonempty matches from pos to end, searching each line on its own"""
+    matches = []
+    line_start = text.rfind('\n', 0, pos) + 1
+    while line_start < end:
+        line_end = text.find('\n', line_start, end)
+        if line_end == -1:
+            line_end = end
+        line = text[line_start : line_end]
+        matches.extend(
+            (line_start + match.start(), line_start + match.end())
+            for match in regex.finditer(line, max(0, pos - line_start))
+            if match.end() > match.start()
+        )
+        line_start = line_end + 1
+    return matches
+
+def scan(regex, table, start, end, pos):
+    """
+    Returns the (start, end) offsets of the nonempty matches that start at or after pos,
+    in the text from start to end. Start must be the start of a line so that ^ works.
+    Matches never run over a line break.
+    """
+    text = table.text(start, end)
+    pos -= start
+    if LINE_SENSITIVE.search(regex.pattern):
+        return [(start + match_start, start + match_end) for match_start, match_end in scan_lines(regex, text, pos, len(text))]
+    # searching the whole text finds the same matches as searching each line, until a match runs over a line break
+    matches = []
+    while pos < len(text):
+        line_end = -1
+        for match in regex.finditer(text, pos):
+            match_start, match_end = match.span()
+            if match_start > line_end:
+                line_end = text.find('\n', match_start)
+                if line_end == -1:
+                    line_end = len(text)
+            if match_end <= line_end:
+                if match_end > match_start:
+                    matches.append((start + match_start, start + match_end))
+                continue
+            # the matches before this one stand, so search the rest of the lines that it runs over
+            # one at a time, then carry on after them
+            first = text.rfind('\n', 0, match_start) + 1
+            if matches and matches[-1][1] > start + first:
+                first = matches[-1][1] - start
+            last = text.find('\n', match_end - 1)
+            if last == -1:
+                last = len(text)
+            matches.extend(
+                (start + match_start, start + match_end)
+                for match_start, match_end in scan_lines(regex, text, max(pos, first), last)
+            )
+            pos = last + 1
+            break
+        else:
+            break
+    return matches
+
+def chunks(table, start, end):
+    """Yields (chunk start, chunk end) for the runs of whole lines that hold the text from start to end"""
+    end = min(end, len(table))
+    if start >= end:
+        return
+    pos = table.line_start(table.line_of(start))
+    while pos < end:
+        stop = chunk_end(table, pos)
+        yield (pos, stop)
+        pos = stop
+
+class Block:
+    """
+    The matches in a run of whole lines of the text.
+    Matches are stored relative to the start of the block, so moving the block is O(1).
+    They are kept in arrays rather than as tuples, so that millions of matches
+    do not slow down the garbage collector.
+    """
+    __slots__ = ('start', 'end', 'match_starts', 'match_ends')
+
+    def __init__(self, start, end, matches):
+        self.start = start
+        self.end = end
+        self.match_starts = array('q', [match_start - start for match_start, _ in matches])
+        self.match_ends = array('q', [match_end - start for _, match_end in matches])
+
+    def __len__(self):
+        return len(self.match_starts)
+
+    def get_match(self, index):
+        return (self.start + self.match_starts[index], self.start + self.match_ends[index])
+
+    def join(self, other):
+        """Adds the matches of the block that follows this one"""
+        moved = other.start - self.start
+        self.match_starts.extend(map(moved.__add__, other.match_starts))
+        self.match_ends.extend(map(moved.__add__, other.match_ends))
+        self.end = other.end
+
+    def splice(self, start, old_end, delta, matches):
+        """Replaces the matches that started from start to old_end with matches, and moves the ones after by delta"""
+        first = bisect_left(self.match_starts, start - self.start)
+        last = bisect_left(self.match_starts, old_end - self.start)
+        new = Block(self.start, self.end, matches)
+        self.match_starts = self.match_starts[ : first] + new.match_starts + array('q', map(delta.__add__, self.match_starts[last : ]))
+        self.match_ends = self.match_ends[ : first] + new.match_ends + array('q', map(delta.__add__, self.match_ends[last : ]))
+        self.end += delta
+
+    def truncate(self, offset):
+        """Removes the matches that start at or after offset"""
+        count = bisect_left(self.match_starts, offset - self.start)
+        del self.match_starts[count : ]
+        del self.match_ends[count : ]
+        self.end = offset
+
+class Search:
+    """
+    Finds the matches of a regular expression in a piece table.
+    Matches are kept in an index of blocks that covers the text from the start up to scanned.
+    Short texts are indexed right away. Longer texts are indexed on a background thread
+    while the first matches are found by scanning the text directly.
+    Edits rescan the changed lines, so the index stays up to date as the text changes.
+    """
+    def __init__(self, pattern, table):
+        self.pattern = pattern
+        self.regex = compile_pattern(pattern)
+        self.table = table
+        self.blocks = []
+        self.starts = [] # start of each block, for binary search
+        self.scanned = 0
+        self.results = [] # blocks found by the background thread
+        self.generation = 0
+        self.edited_from = None # lowest offset edited after the index since the background thread started
+        self.shift = 0 # how far edits in the index have moved the text the background thread is scanning
+        self.thread = None
+        if len(table) <= BACKGROUND_LIMIT:
+            self.index(table)
+        else:
+            self.start_thread()
+
+    def index(self, table, end = None):
+        """Indexes the text from the end of the index to end on this thread"""
+        for start, end in chunks(table, self.scanned, len(table) if end is None else end):
+            self.add_block(Block(start, end, scan(self.regex, table, start, end, start)))
+
+    def add_block(self, block):
+        self.blocks.append(block)
+        self.starts.append(block.start)
+        self.scanned = block.end
+
+    def start_thread(self):
+        self.generation += 1
+        self.results = []
+        self.edited_from = None
+        self.shift = 0
+        self.thread = threading.Thread(
+            target = self.scan_background,
+            args = (self.table, self.scanned, self.generation, self.results),
+            daemon = True
+        )
+        self.thread.start()
+
+    def scan_background(self, table, start, generation, results):
+        for chunk_start, chunk_end in chunks(table, start, len(table)):
+            if generation != self.generation:
+                return
+            matches = scan(self.regex, table, chunk_start, chunk_end, chunk_start)
+            results.append(Block(chunk_start, chunk_end, matches))
+
+    def is_done(self):
+        return self.scanned >= len(self.table) and self.thread is None
+
+    def poll(self):
+        """Adds the blocks found in the background to the index. Returns the (start, end) they cover"""
+        if self.thread is None:
+            return None
+        running = self.thread.is_alive()
+        # the thread keeps appending to the list, so take the blocks out of it in place
+        count = len(self.results)
+        results = self.results[ : count]
+        del self.results[ : count]
+        start = self.scanned
+        for block in results:
+            # the thread scans the text as it was when it started
+            if block.start + self.shift != self.scanned or (self.edited_from is not None and block.end >= self.edited_from):
+                # the text has changed since this block was scanned, so index past the change
+                # here and let the thread carry on after it
+                if self.edited_from is not None:
+                    self.index(self.table, self.edited_from + self.shift + 1)
+                self.start_thread()
+                break
+            block.start += self.shift
+            block.end += self.shift
+            self.add_block(block)
+        else:
+            if not running:
+                self.thread = None
+                if self.scanned < len(self.table):
+                    # text was edited or loaded after the thread finished
+                    self.start_thread()
+        return (start, self.scanned) if self.scanned > start else None
+
+    def update(self, table):
+        """Follows text that was added to the end without an edit, such as a file being loaded"""
+        self.table = table
+        if self.thread is None and self.scanned < len(table):
+            if len(table) - self.scanned <= SCAN_CHUNK:
+                self.index(table)
+            else:
+                self.start_thread()
+
+    def edited(self, table, offset, removed, inserted):
+        """Rescans the lines changed by an edit and moves the matches after them"""
+        self.table = table
+        if offset > self.scanned:
+            if self.thread is not None and (self.edited_from is None or offset - self.shift < self.edited_from):
+                self.edited_from = offset - self.shift
+            return
+        delta = inserted - removed
+        # the changed lines, in offsets from after the edit
+        start = table.line_start(table.line_of(offset))
+        end = min(len(table), table.line_end(table.line_of(offset + inserted)) + 1)
+        old_end = end - delta
+        if old_end >= self.scanned:
+            # the edit reaches the end of the index, so index from its start again
+            self.truncate(start)
+            self.update(table)
+            return
+        first = max(0, bisect_right(self.starts, start) - 1)
+        last = max(0, bisect_right(self.starts, old_end - 1) - 1)
+        block = self.blocks[first]
+        if last > first:
+            # the changed lines span several blocks, so they become one block
+            for other in self.blocks[first + 1 : last + 1]:
+                block.join(other)
+            del self.blocks[first + 1 : last + 1]
+            del self.starts[first + 1 : last + 1]
+        block.splice(start, old_end, delta, scan(self.regex, table, start, end, start))
+        for block in self.blocks[first + 1 : ]:
+            block.start += delta
+            block.end += delta
+        self.starts[first + 1 : ] = [block_start + delta for block_start in self.starts[first + 1 : ]]
+        self.scanned += delta
+        self.shift += delta
+
+    def truncate(self, offset):
+        """Removes the index of the text after the start of the line at offset"""
+        index = bisect_right(self.starts, offset) - 1
+        if index >= 0:
+            self.blocks[index].truncate(offset)
+        del self.blocks[index + 1 : ]
+        del self.starts[index + 1 : ]
+        self.scanned = min(self.scanned, offset)
+        if self.thread is not None:
+            self.start_thread()
+
+    def indexed_matches(self, start, end):
+        """Yields the indexed matches that start from start to end [inclusive, exclusive)"""
+        index = max(0, bisect_right(self.starts, start) - 1)
+        for block in self.blocks[index : ]:
+            if block.start >= end:
+                return
+            for index in range(bisect_left(block.match_starts, start - block.start), len(block)):
+                match = block.get_match(index)
+                if match[0] >= end:
+                    return
+                yield match
+
+    def last_indexed_match(self, start, end):
+        """Returns the last indexed match that starts from start to end [inclusive, exclusive), or None"""
+        index = bisect_right(self.starts, end - 1) - 1
+        while index >= 0 and self.blocks[index].end > start:
+            block = self.blocks[index]
+            last = bisect_left(block.match_starts, end - block.start) - 1
+            if last >= 0:
+                match = block.get_match(last)
+                return match if match[0] >= start else None
+            index -= 1
+        return None
+
+    def get_matches(self, start, end):
+        """Returns the matches that start from start to end, scanning the part that is not indexed yet"""
+        matches = list(self.indexed_matches(start, min(end, self.scanned)))
+        if end > self.scanned:
+            start = max(start, self.scanned)
+            text_end = min(len(self.table), self.table.line_end(self.table.line_of(end)) + 1)
+            line_start = self.table.line_start(self.table.line_of(start))
+            matches.extend(match for match in scan(self.regex, self.table, line_start, text_end, start) if match[0] < end)
+        return matches
+
+    def find_forward(self, start, end):
+        """Returns the first match that starts from start to end, or None"""
+        match = next(self.indexed_matches(start, min(end, self.scanned)), None)
+        if match is not None or end <= self.scanned:
+            return match
+        for chunk_start, chunk_end in chunks(self.table, max(start, self.scanned), end):
+            matches = scan(self.regex, self.table, chunk_start, chunk_end, max(start, chunk_start))
+            matches = [match for match in matches if match[0] < end]
+            if matches:
+                return matches[0]
+        return None
+
+    def find_backward(self, start, end):
+        """Returns the last match that starts from start to end, or None"""
+        chunk_end = end
+        while chunk_end > max(start, self.scanned):
+            chunk_start = self.table.line_start(self.table.line_of(max(start, self.scanned, chunk_end - SCAN_CHUNK)))
+            matches = self.get_matches(max(start, chunk_start), chunk_end)
+            if matches:
+                return matches[-1]
+            chunk_end = chunk_start
+        return self.last_indexed_match(start, min(end, self.scanned))
+
+    def find(self, offset, backwards = False):
+        """Returns the next match after offset, or the previous match before it, wrapping around the text"""
+        if backwards:
+            return self.find_backward(0, offset) or self.find_backward(offset, len(self.table))
+        return self.find_forward(offset + 1, len(self.table)) or self.find_forward(0, offset + 1)
+
+    def get_status(self, match):
+        """Returns a message giving the number of a match and how many matches there are"""
+        if match is None:
+            return f'Pattern not found: {self.pattern}'
+        if match[0] >= self.scanned:
+            return f'/{self.pattern}'
+        index = bisect_right(self.starts, match[0]) - 1
+        block = self.blocks[index]
+        number = sum(map(len, self.blocks[ : index])) + bisect_right(block.match_starts, match[0] - block.start)
+        total = sum(map(len, self.blocks))
+        return f'/{self.pattern}: match {number} of {total}{"" if self.is_done() else "+"}'
@@ -4,19 +4,37 @@ import sys
 from base import *
 from buffer import *
 from keys import *
+from marks import SELECT_END, SELECT_START
 from position import *
 from state import StateManager
 
 class SelectMode(Mode):
-    def __init__(self, buffer, state_manager, caret, file_name, args):
-        super().__init__(buffer, state_manager, caret, file_name, args)
+    def __init__(self, buffer, state_manager, caret, file_name, args, registers):
+        super().__init__(buffer, state_manager, caret, file_name, args, registers)
         self.name = MODE_SELECT
         self.cur_command = ''
-        self.select_start_pos = self.caret.copy()
-        self.select_end_pos = self.caret.copy()
+        self.select_start_pos = self.caret
+        self.select_end_pos = self.caret
         # stores whether the last position of the caret outside of the selection is before or after it
         self.last_pos_before = True 
 
+    # the ends of the selection are marks, so that they move with the text
+    @property
+    def select_start_pos(self):
+        return self.buffer.get_mark(SELECT_START)
+
+    @select_start_pos.setter
+    def select_start_pos(self, pos):
+        self.buffer.set_mark(SELECT_START, pos)
+
+    @property
+    def select_end_pos(self):
+        return self.buffer.get_mark(SELECT_END)
+
+    @select_end_pos.setter
+    def select_end_pos(self, pos):
+        self.buffer.set_mark(SELECT_END, pos)
+
     def calculate_selection(self):
         if self.caret.is_before(self.select_start_pos):
             # expand selection left
@@ -33,42 +51,38 @@ class SelectMode(Mode):
             # shrink collection left
             self.select_end_pos = self.caret.copy()
     
+    def get_selected_span(self):
+        """Returns the offsets of the selected text [inclusive, exclusive), which never includes the last newline"""
+        start = self.buffer.get_offset(self.select_start_pos)
+        end = self.buffer.get_offset(self.select_end_pos) + 1
+        return (start, min(end, self.buffer.line_end(self.select_end_pos.y)))
+
     def parse_command(self, command, args = []):
         # try to parse a general command
         res = self.parse_general_command(command, args)
         if res is not None:
+            if command in ['g', 'j']:
+                self.calculate_selection()
             return res
         # try specific commands
         if command == 'x':
+            # cut the selection into the register named by the first argument
+            start, end = self.get_selected_span()
+            self.registers.yank(args[0] if args else None, self.buffer.get_range(start, end))
             # set caret position to selection start position
             self.caret = self.select_start_pos.copy()
-            if self.select_start_pos.y == self.select_end_pos.y:
-                # delete substring
-                dif = self.select_end_pos.x - self.select_start_pos.x + 1
-                self.buffer.delete_substr(
-                    self.select_start_pos.y,
-                    self.select_start_pos.x,
-                    self.select_start_pos.x + dif
-                )
-            else:
-                # delete inbetween
-                index = self.select_start_pos.y + 1
-                for _ in range(index, self.select_end_pos.y):
-                    self.buffer.pop_line(index)
-                # delete ending of start
-                spaces = self.buffer.get_line_length(self.select_start_pos.y) - self.select_start_pos.x
-                self.buffer.delete_substr(
-                    self.select_start_pos.y,
-                    self.select_start_pos.x,
-                    self.select_start_pos.x + spaces
-                )
-                # delete starting of end
-                spaces = self.select_end_pos.x + 1
-                self.buffer.delete_substr(index, 0, spaces)
-                if self.buffer.get_line(index) == '':
-                    self.buffer.pop_line(index)
+            # the text is removed in one edit, however many lines it spans.
+            # the start and end of a selection over several lines are left on separate lines,
+            # unless nothing is left of the end line
+            multiline = self.select_start_pos.y != self.select_end_pos.y
+            self.buffer.replace(start, end, '\n' if multiline and end < self.buffer.line_end(self.select_end_pos.y) else '')
             self.push_state()
             return MODE_COMMAND
+        elif command == 'c':
+            # copy the selection into the register named by the first argument
+            self.registers.yank(args[0] if args else None, self.buffer.get_range(*self.get_selected_span()))
+            self.caret = self.select_start_pos.copy()
+            return MODE_COMMAND
         return MODE_SELECT
 
     def parse_key(self, key):
@@ -77,16 +91,16 @@ class SelectMode(Mode):
         elif key == 'KEY_BACKSPACE':
             self.cur_command = self.cur_command[ : -1]
         elif key in ['KEY_LEFT', 'KEY_BACKSPACE']:
-            self.caret.move_left(self.buffer)
+            self.caret.move_left(self.buffer, self.take_count())
             self.calculate_selection()
         elif key in ['KEY_RIGHT', ' ']:
-            self.caret.move_right(self.buffer)
+            self.caret.move_right(self.buffer, self.take_count())
             self.calculate_selection()
         elif key == 'KEY_UP':
-            self.caret.move_up(self.buffer)
+            self.caret.move_up(self.buffer, self.take_count())
             self.calculate_selection()
         elif key == 'KEY_DOWN':
-            self.caret.move_down(self.buffer)
+            self.caret.move_down(self.buffer, self.take_count())
             self.calculate_selection()
         elif key == 'KEY_PAGE_UP':
             self.caret = Position(0, 0)
@@ -105,9 +119,13 @@ class SelectMode(Mode):
             self.calculate_selection()
         elif key == 'KEY_NEWLINE':
             try:
-                return self.parse_command(*self.parse_args(self.cur_command))
+                return self.parse_repeated(self.cur_command)
             finally:
                 self.cur_command = ''
+        elif key == 'KEY_PASTE':
+            # paste the first line of the text into the command
+            text = key.text.split('\n')[0]
+            self.cur_command = (self.cur_command + text)[ : MAX_COMMAND_LENGTH]
         elif ischar(key):
             if len(self.cur_command) < MAX_COMMAND_LENGTH:
                 self.cur_command += key
@@ -0,0 +1,48 @@
+import os
+import time
+
+def get_process_age():
+    """Returns the number of seconds since the process started, or None if the system doesn't say"""
+    try:
+        with open('/proc/self/stat') as stat_file:
+            # the name of the program is in brackets and may contain spaces
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def mark(timer, name):
+    """Marks the end of a phase if timer is not None"""
+    if timer is not None:
+        timer.mark(name)
+
+class StartupTimer:
+    """
+    Times the phases of starting the editor, from the first import of dim.py to the first frame.
+    Each phase lasts from the end of the one before it until it is marked.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = [] # (name, seconds) of each phase in order
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def get_report(self):
+        """Returns the lines of a table of the time taken by each phase, in milliseconds"""
+        lines = []
+        # the time before dim.py ran is only known to the nearest clock tick of the system
+        age = get_process_age()
+        if age is not None:
+            before = max(0, age - (time.perf_counter() - self.start))
+            lines.append(f'{"python startup (approximate)":<32}{before * 1000:>9.1f} ms')
+        for name, seconds in self.phases:
+            lines.append(f'{name:<32}{seconds * 1000:>9.1f} ms')
+        total = sum([seconds for _, seconds in self.phases])
+        lines.append(f'{"total since dim.py started":<32}{total * 1000:>9.1f} ms')
+        return lines
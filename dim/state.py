@@ -1,38 +1,188 @@
+import pickle
 import zlib
 
+from position import Position
+
+# number of journal entries in each compressed checkpoint
+CHECKPOINT_INTERVAL = 256
+
+def invert_changes(changes):
+    """Returns the changes that undo a list of (offset, removed, inserted) changes"""
+    return [(offset, inserted, removed) for offset, removed, inserted in reversed(changes)]
+
+class Segment:
+    """
+    A run of consecutive journal entries.
+    Once a segment is full it is compressed into a checkpoint and only decompressed
+    again when undo or redo reaches it. Checkpoints may be spilled to a file,
+    in which case location holds their (position, length) in that file.
+    """
+    __slots__ = ('entries', 'data', 'location')
+
+    def __init__(self, entries = None):
+        self.entries = entries if entries is not None else []
+        self.data = None
+        self.location = None
+
+    def compress(self):
+        if self.data is None and self.location is None:
+            self.data = zlib.compress(pickle.dumps(self.entries))
+        self.entries = None
+
+    def decompress(self, spill_file = None):
+        if self.entries is None:
+            data = self.data
+            if data is None:
+                spill_file.seek(self.location[0])
+                data = spill_file.read(self.location[1])
+            self.entries = pickle.loads(zlib.decompress(data))
+        return self.entries
+
+    def spill(self, spill_file):
+        """Moves the checkpoint out of memory and into the end of spill_file"""
+        spill_file.seek(0, 2)
+        self.location = (spill_file.tell(), len(self.data))
+        spill_file.write(self.data)
+        self.data = None
+
 class StateManager:
-    def __init__(self):
+    """
+    Stores the history of the buffer as a journal of edits.
+    Each entry holds the changes made by one edit with the caret before and after it.
+    Undo applies the inverse of the changes, so its cost depends on the size of the edit.
+    If memory_budget is set, checkpoints over the budget are spilled to a temporary file.
+    """
+    def __init__(self, memory_budget = None):
         self.saved = True
         self.undo_stack = []
         self.undo_ptr = -1
+        self.caret = (0, 0)
+        self.open_segment = None
+        self.memory_budget = memory_budget
+        self.spill_file = None
+        self.spilled = 0 # number of segments at the start of the stack that are in the spill file
+        self.batch_depth = 0 # how many batches have been started and not ended
+        self.batch = [] # changes pushed during the current batch
+        self.batch_caret = None # caret after the last edit of the current batch
+
+    def get_length(self):
+        if not self.undo_stack:
+            return 0
+        return (len(self.undo_stack) - 1) * CHECKPOINT_INTERVAL + len(self.undo_stack[-1].decompress())
+
+    def get_entry(self, index):
+        seg_index = index // CHECKPOINT_INTERVAL
+        last_index = len(self.undo_stack) - 1
+        if self.open_segment not in (None, seg_index, last_index):
+            # only keep one old segment decompressed at a time
+            self.undo_stack[self.open_segment].compress()
+        if seg_index != last_index:
+            self.open_segment = seg_index
+        return self.undo_stack[seg_index].decompress(self.spill_file)[index % CHECKPOINT_INTERVAL]
+
+    def get_memory(self):
+        """Returns the number of bytes used by checkpoints that are kept in memory"""
+        return sum([len(seg.data) for seg in self.undo_stack if seg.data is not None])
+
+    def enforce_budget(self):
+        if self.memory_budget is None:
+            return
+        memory = self.get_memory()
+        while memory > self.memory_budget and self.spilled < len(self.undo_stack) - 1:
+            seg = self.undo_stack[self.spilled]
+            if seg.data is not None:
+                if self.spill_file is None:
+                    # imported here since most sessions never spill
+                    import tempfile
+                    self.spill_file = tempfile.TemporaryFile()
+                memory -= len(seg.data)
+                seg.spill(self.spill_file)
+            self.spilled += 1
+
+    def truncate(self, length):
+        """Removes all entries after the first length entries"""
+        seg_count = (length + CHECKPOINT_INTERVAL - 1) // CHECKPOINT_INTERVAL
+        if seg_count < self.spilled:
+            # the spilled checkpoints being removed are at the end of the spill file
+            self.spill_file.truncate(self.undo_stack[seg_count].location[0])
+            self.spilled = seg_count
+        del self.undo_stack[seg_count : ]
+        if self.open_segment is not None and self.open_segment >= seg_count - 1:
+            self.open_segment = None
+        if self.undo_stack:
+            last = self.undo_stack[-1]
+            entries = last.decompress(self.spill_file)[ : length - (seg_count - 1) * CHECKPOINT_INTERVAL]
+            self.undo_stack[-1] = Segment(entries)
+            if seg_count == self.spilled:
+                # the last segment is back in memory and open for writing
+                self.spill_file.truncate(last.location[0])
+                self.spilled -= 1
+
+    def start_batch(self):
+        """Collects the edits pushed until the matching end_batch into one entry, which is undone in one step"""
+        self.batch_depth += 1
 
-    def compress_text(self, text):
-        return zlib.compress(text.encode())
+    def end_batch(self, caret):
+        self.batch_depth -= 1
+        if self.batch_depth == 0:
+            self.push_batch(caret)
 
-    def decompress_text(self, text):
-        return zlib.decompress(text).decode()
+    def push_batch(self, caret = None):
+        """Pushes the changes collected so far by the current batch as one entry"""
+        changes, self.batch = self.batch, []
+        if changes:
+            depth, self.batch_depth = self.batch_depth, 0
+            self.push_state(self.batch_caret if caret is None else caret, changes)
+            self.batch_depth = depth
 
-    def push_state(self, caret, text):
+    def push_state(self, caret, changes):
+        if self.batch_depth > 0:
+            self.batch.extend(changes)
+            self.batch_caret = caret.copy()
+            return
+        if not changes:
+            self.caret = (caret.y, caret.x)
+            return
         self.saved = False
-        self.undo_stack = self.undo_stack[ : self.undo_ptr + 1]
+        self.truncate(self.undo_ptr + 1)
+        if not self.undo_stack or len(self.undo_stack[-1].decompress()) == CHECKPOINT_INTERVAL:
+            if self.undo_stack:
+                self.undo_stack[-1].compress()
+                self.enforce_budget()
+            self.undo_stack.append(Segment())
+        self.undo_stack[-1].entries.append((tuple(changes), self.caret, (caret.y, caret.x)))
+        self.caret = (caret.y, caret.x)
         self.undo_ptr += 1
-        self.undo_stack.append((caret.copy(), self.compress_text(text)))
 
     def undo(self):
+        """Returns the caret and the changes that revert the last edit"""
+        # the edits of a batch so far are undone before the ones before it
+        self.push_batch()
+        if self.undo_ptr < 0:
+            return (None, None)
         self.saved = False
-        self.undo_ptr = max(0, self.undo_ptr - 1)
-        caret, compressed = self.undo_stack[self.undo_ptr]
-        return (caret, self.decompress_text(compressed))
+        changes, before, _ = self.get_entry(self.undo_ptr)
+        self.undo_ptr -= 1
+        self.caret = before
+        return (Position(*before), invert_changes(changes))
 
     def redo(self):
-        if self.undo_ptr + 1 < len(self.undo_stack):
+        """Returns the caret and the changes that reapply the last undone edit"""
+        self.push_batch()
+        if self.undo_ptr + 1 < self.get_length():
             self.saved = False
             self.undo_ptr += 1
-            caret, compressed = self.undo_stack[self.undo_ptr]
-            return (caret, self.decompress_text(compressed))
+            changes, _, after = self.get_entry(self.undo_ptr)
+            self.caret = after
+            return (Position(*after), list(changes))
         return (None, None)
 
-    def clear_stack(self):
+    def clear_stack(self, caret = None):
         self.undo_ptr = -1
         self.undo_stack = []
+        self.open_segment = None
+        self.spilled = 0
+        if self.spill_file is not None:
+            self.spill_file.truncate(0)
+        self.caret = (caret.y, caret.x) if caret is not None else (0, 0)
         self.saved = True
@@ -0,0 +1,230 @@
+import atexit
+import os
+import stat
+import struct
+import threading
+from collections import deque
+
+# seconds between writes of new edits to the swap file
+AUTOSAVE_INTERVAL = 1.0
+# swap files start with this, followed by the header and the records
+SWAP_MAGIC = b'DIMSWAP\n'
+SWAP_VERSION = 2
+# version, pid of the editor writing the swap file, size and modification time of the file,
+# and the length of its path, which follows in bytes
+HEADER = struct.Struct('<IIqqI')
+# position of the pid, which an editor that recovers the edits overwrites with its own
+PID_OFFSET = len(SWAP_MAGIC) + 4
+# offset, removed length and length of the inserted text, which follows in UTF-8
+RECORD = struct.Struct('<qqQ')
+# lone surrogates from bytes that the file's encoding could not decode are kept as they are
+TEXT_ERRORS = 'surrogatepass'
+
+def get_swap_path(path):
+    """Returns the path of the swap file kept next to a file"""
+    path = os.path.realpath(path)
+    return os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.swp')
+
+def get_file_info(path):
+    """Returns what the swap file remembers about the file it was made from"""
+    path = os.path.realpath(path)
+    info = os.stat(path)
+    return {'file': path, 'size': info.st_size, 'mtime': info.st_mtime_ns}
+
+def encode_header(info, pid):
+    path = os.fsencode(info['file'])
+    return SWAP_MAGIC + HEADER.pack(SWAP_VERSION, pid, info['size'], info['mtime'], len(path)) + path
+
+def encode_record(offset, removed, inserted):
+    text = inserted.encode('utf-8', TEXT_ERRORS)
+    return RECORD.pack(offset, removed, len(text)) + text
+
+def is_owned(swap_path):
+    """Checks that a swap file is a regular file of the current user, so that one planted by someone else is never read"""
+    info = os.lstat(swap_path)
+    return stat.S_ISREG(info.st_mode) and (not hasattr(os, 'getuid') or info.st_uid == os.getuid())
+
+def is_running(pid):
+    """Checks whether the editor that wrote a swap file is still running"""
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill would end the process rather than check for it
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # the process exists but belongs to someone else
+        return True
+    return True
+
+def read_pid(swap_path):
+    """Returns the pid of the editor writing a swap file, or None if it can't be read"""
+    try:
+        with open(swap_path, 'rb') as swap_file:
+            data = swap_file.read(len(SWAP_MAGIC) + HEADER.size)
+    except OSError:
+        return None
+    if not data.startswith(SWAP_MAGIC) or len(data) < len(SWAP_MAGIC) + HEADER.size:
+        return None
+    return HEADER.unpack_from(data, len(SWAP_MAGIC))[1]
+
+def read_swap(swap_path):
+    """
+    Reads a swap file. Returns (info, pid, records, end), where pid is the editor that wrote it
+    and end is the position just after the last complete record. Returns None if there is no
+    swap file, or it is not one that an editor of the current user wrote.
+    A record cut short by a crash is ignored along with anything after it.
+    """
+    try:
+        if not is_owned(swap_path):
+            return None
+        with open(swap_path, 'rb') as swap_file:
+            data = swap_file.read()
+    except OSError:
+        return None
+    pos = len(SWAP_MAGIC) + HEADER.size
+    if not data.startswith(SWAP_MAGIC) or len(data) < pos:
+        return None
+    version, pid, size, mtime, path_length = HEADER.unpack_from(data, len(SWAP_MAGIC))
+    if version != SWAP_VERSION or pos + path_length > len(data):
+        return None
+    info = {'file': os.fsdecode(data[pos : pos + path_length]), 'size': size, 'mtime': mtime}
+    pos += path_length
+    records = []
+    end = pos
+    while pos + RECORD.size <= len(data):
+        offset, removed, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if offset < 0 or removed < 0 or pos + length > len(data):
+            break
+        try:
+            inserted = data[pos : pos + length].decode('utf-8', TEXT_ERRORS)
+        except UnicodeDecodeError:
+            break
+        records.append((offset, removed, inserted))
+        pos += length
+        end = pos
+    return (info, pid, records, end)
+
+def remove_swap(swap_path):
+    """Removes a swap file left behind by an editor that is no longer running"""
+    try:
+        os.remove(swap_path)
+    except OSError:
+        pass
+
+def is_current(info, path):
+    """Checks whether the file is still the one the swap file was made from"""
+    try:
+        return get_file_info(path) == info
+    except OSError:
+        return False
+
+def create_swap(path, info, records = ()):
+    """
+    Creates a swap file written by this editor, which fails if there is a file at path already,
+    so that the swap file of another editor is never replaced. Returns the open file.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o600)
+    swap_file = os.fdopen(fd, 'wb')
+    swap_file.write(encode_header(info, os.getpid()))
+    for record in records:
+        swap_file.write(encode_record(*record))
+    # another editor opening the file reads the pid straight away
+    swap_file.flush()
+    return swap_file
+
+class SwapTakenError(Exception):
+    """The swap file was replaced by another editor, which autosaves to it from now on"""
+
+class SwapFile:
+    """
+    Keeps a journal of the edits made since the file was last saved, so that they
+    can be recovered after a crash. Each record is (offset, removed length, inserted text),
+    which is only the changed part of the text.
+    Recording an edit only queues it. A background thread appends the queued records
+    to the file and syncs it every AUTOSAVE_INTERVAL seconds, so typing never waits for the disk.
+    The header holds the pid of the editor writing the file, and no other editor replaces or removes it.
+    """
+    def __init__(self, path, records = (), resume_at = None):
+        """
+        Starts a swap file for the file at path holding records.
+        If resume_at is given, the existing swap file is kept up to that position and appended to.
+        """
+        self.path = get_swap_path(path)
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.error = None
+        if resume_at is not None:
+            # take over the swap file left behind by an editor that is no longer running
+            self.swap_file = open(self.path, 'r+b')
+            self.swap_file.truncate(resume_at)
+            self.swap_file.seek(PID_OFFSET)
+            self.swap_file.write(struct.pack('<I', os.getpid()))
+            self.swap_file.seek(resume_at)
+        else:
+            # the file is created straight away, so that an editor already writing one is found
+            self.swap_file = create_swap(self.path, get_file_info(path))
+            self.pending.extend(records)
+            self.wake.set()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        # write the last few edits if the editor exits without closing the swap file
+        atexit.register(self.write_pending)
+
+    def record(self, offset, removed, inserted):
+        self.pending.append((offset, removed, inserted))
+
+    def restart(self, path, records = ()):
+        """Starts the journal again from the file at path as it is now, followed by records"""
+        self.pending.append(('restart', get_file_info(path), list(records)))
+        self.wake.set()
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(AUTOSAVE_INTERVAL)
+            self.wake.clear()
+            self.write_pending()
+
+    def write_pending(self):
+        with self.lock:
+            if self.closed or self.error is not None or not self.pending:
+                return
+            try:
+                while self.pending:
+                    record = self.pending.popleft()
+                    if record[0] == 'restart':
+                        self.rewrite(*record[1 : ])
+                    else:
+                        self.swap_file.write(encode_record(*record))
+                self.swap_file.flush()
+                os.fsync(self.swap_file.fileno())
+            except Exception as e:
+                # stop autosaving rather than interrupt editing
+                self.error = e
+
+    def rewrite(self, info, records):
+        """Replaces the swap file with a new one without ever leaving a partial file in its place"""
+        if read_pid(self.path) != os.getpid():
+            raise SwapTakenError(self.path)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with create_swap(temp_path, info, records) as temp_file:
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        self.swap_file.close()
+        os.replace(temp_path, self.path)
+        self.swap_file = open(self.path, 'ab')
+
+    def close(self):
+        """Stops autosaving and removes the swap file, unless another editor has taken it over"""
+        with self.lock:
+            self.closed = True
+            self.swap_file.close()
+            if read_pid(self.path) == os.getpid():
+                remove_swap(self.path)
+        self.wake.set()
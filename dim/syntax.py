@@ -0,0 +1,156 @@
+import keyword
+import os
+import re
+from bisect import bisect_right, insort
+
+# color pairs of the kinds of token
+COLOR_KEYWORD = 9
+COLOR_STRING = 10
+COLOR_COMMENT = 11
+COLOR_NUMBER = 12
+
+# lexer classes by file extension
+LEXERS = {}
+
+def register_lexer(*extensions):
+    """Class decorator that makes a lexer highlight files with the given extensions"""
+    def register(cls):
+        for extension in extensions:
+            LEXERS[extension] = cls
+        return cls
+    return register
+
+def get_lexer(file_name):
+    """Returns a lexer for the file, or None if its type isn't known"""
+    if file_name is None:
+        return None
+    cls = LEXERS.get(os.path.splitext(file_name)[1].lower())
+    return cls() if cls is not None else None
+
+class Lexer:
+    """
+    Splits lines into colored tokens.
+    A lexer reads one line at a time, starting in the state that the previous line ended in,
+    so that constructs spanning several lines (such as block comments) can be followed.
+    States must be comparable with ==, so that a changed line whose end state is the same
+    as before is known not to affect the lines after it.
+    """
+    initial_state = None
+
+    def tokenize(self, line, state):
+        """Returns a list of (x1, x2, color) [inclusive, exclusive) and the state at the end of the line"""
+        return ([], state)
+
+@register_lexer('.py', '.pyw')
+class PythonLexer(Lexer):
+    """Highlights Python. The state is the quotes of an unfinished triple quoted string, or None"""
+    TOKEN_RE = re.compile(
+        r'(?P<comment>#.*)'
+        r'|(?P<triple>[rRbBuUfF]{0,2}(?:"""|\'\'\'))'
+        r'|(?P<string>[rRbBuUfF]{0,2}(?:"(?:\\.|[^"\\])*"?|\'(?:\\.|[^\'\\])*\'?))'
+        r'|(?P<number>\b(?:0[xXoObB][0-9a-fA-F_]+|\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?j?)\b)'
+        r'|(?P<word>[A-Za-z_]\w*)'
+    )
+    KEYWORDS = frozenset(keyword.kwlist)
+
+    def tokenize(self, line, state):
+        tokens = []
+        pos = 0
+        if state is not None:
+            # inside a triple quoted string
+            end = line.find(state)
+            if end == -1:
+                return ([(0, len(line), COLOR_STRING)], state)
+            pos = end + 3
+            tokens.append((0, pos, COLOR_STRING))
+            state = None
+        while True:
+            match = self.TOKEN_RE.search(line, pos)
+            if match is None:
+                return (tokens, None)
+            kind = match.lastgroup
+            start, pos = match.span()
+            if kind == 'comment':
+                tokens.append((start, pos, COLOR_COMMENT))
+            elif kind == 'triple':
+                quotes = line[pos - 3 : pos]
+                end = line.find(quotes, pos)
+                if end == -1:
+                    tokens.append((start, len(line), COLOR_STRING))
+                    return (tokens, quotes)
+                pos = end + 3
+                tokens.append((start, pos, COLOR_STRING))
+            elif kind == 'string':
+                tokens.append((start, pos, COLOR_STRING))
+            elif kind == 'number':
+                tokens.append((start, pos, COLOR_NUMBER))
+            elif match.group() in self.KEYWORDS:
+                tokens.append((start, pos, COLOR_KEYWORD))
+
+# the state of a line that has not been tokenized since it was added
+UNKNOWN = object()
+
+class Highlighter:
+    """
+    Colors the lines of a buffer with a lexer.
+    The state at the end of each line is cached, but only for the lines that have been shown.
+    After an edit, lines are only tokenized again from the changed line until a line
+    ends in the same state as before, and only as far down as the screen reaches.
+    """
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.reset()
+
+    def reset(self):
+        self.states = [] # state at the end of each line
+        self.valid = 0 # number of lines at the start of states that are known to be right
+        self.edits = [] # sorted lines after valid from which the cached states have to be checked again
+
+    def edited(self, y, removed_lines, inserted_lines):
+        """Forgets the states of the lines changed by an edit starting on line y"""
+        if y >= len(self.states):
+            return
+        last = y + removed_lines
+        if last >= len(self.states):
+            del self.states[y : ]
+        else:
+            # the last changed line ends where the old one did, so its old state is kept to compare against
+            self.states[y : last + 1] = [UNKNOWN] * inserted_lines + [self.states[last]]
+        moved = inserted_lines - removed_lines
+        edits = [edit if edit < y else edit + moved for edit in self.edits if not y <= edit <= last]
+        insort(edits, y)
+        self.edits = [edit for edit in edits if edit < len(self.states)]
+        self.valid = min(self.valid, y)
+
+    def get_state(self, y):
+        """Returns the state at the start of line y, which must have been updated"""
+        return self.states[y - 1] if y > 0 else self.lexer.initial_state
+
+    def update(self, lines, end):
+        """
+        Makes sure the states of the first end lines are right.
+        Returns the lines whose starting state changed, whose colors may have changed as well.
+        """
+        changed = []
+        while self.valid < end and self.valid < len(lines):
+            y = self.valid
+            del self.edits[ : bisect_right(self.edits, y)]
+            _, state = self.lexer.tokenize(lines[y], self.get_state(y))
+            self.valid = y + 1
+            if y == len(self.states):
+                self.states.append(state)
+            elif self.states[y] == state:
+                # the lines after this one are colored as before, up to the next edited line
+                self.valid = self.edits[0] if self.edits else len(self.states)
+            else:
+                if self.states[y] is not UNKNOWN:
+                    changed.append(y + 1)
+                self.states[y] = state
+        if self.valid < len(self.states) and self.valid not in self.edits[ : 1]:
+            # the next state was made from the old state of this line, so it has to be checked like an edit
+            self.edits.insert(0, self.valid)
+        return changed
+
+    def get_colors(self, line, y):
+        """Returns the (x1, x2, color) tokens of line y, whose starting state must have been updated"""
+        return self.lexer.tokenize(line, self.get_state(y))[0]
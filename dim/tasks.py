@@ -0,0 +1,71 @@
+class Job:
+    """A function run in the background by Tasks, which can be cancelled"""
+    def __init__(self, name, done):
+        self.name = name
+        self.done = done # called with the result on the editor's thread
+        self.cancelled = False # checked by the function if it can stop early
+        self.future = None
+
+    def cancel(self):
+        """Stops the job if it has not started yet, and drops its result if it has"""
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+class Tasks:
+    """
+    Runs jobs for the modes on worker threads while the editor keeps handling keys.
+    The result of a job is handed back to a callback on the editor's thread, and the screen
+    is drawn again. Only one job runs under each name, so starting a job cancels the last one.
+    """
+    def __init__(self):
+        self.loop = None
+        self.on_done = None # called on the editor's thread after a job has handed back its result
+        self.jobs = {} # running jobs by name
+
+    def start(self, loop, on_done):
+        """Runs jobs on the executor of an event loop from now on. Until then, jobs are run straight away"""
+        self.loop = loop
+        self.on_done = on_done
+
+    def stop(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self.jobs = {}
+        self.loop = None
+
+    def is_running(self, name):
+        return name in self.jobs
+
+    def cancel(self, name):
+        if (job := self.jobs.pop(name, None)) is not None:
+            job.cancel()
+
+    def run(self, name, func, *args, done = None):
+        """
+        Runs func(job, *args) in the background, then calls done(result) on the editor's thread.
+        Returns the Job, which can be cancelled.
+        """
+        self.cancel(name)
+        job = Job(name, done)
+        if self.loop is None:
+            # there is no event loop, as in the benchmarks, so the job holds up the key that started it
+            result = func(job, *args)
+            if done is not None:
+                done(result)
+            return job
+        self.jobs[name] = job
+        job.future = self.loop.run_in_executor(None, func, job, *args)
+        job.future.add_done_callback(lambda future: self.finish(job, future))
+        return job
+
+    def finish(self, job, future):
+        if self.jobs.get(job.name) is job:
+            del self.jobs[job.name]
+        if job.cancelled or future.cancelled():
+            return
+        # an error in the job is raised here, on the editor's thread
+        result = future.result()
+        if job.done is not None:
+            job.done(result)
+        self.on_done()
@@ -0,0 +1,20 @@
+import curses
+import sys
+
+class Terminal:
+    """
+    The curses calls that the editor makes outside of a window, and writes straight to the terminal.
+    A HeadlessScreen makes the same calls when there is no terminal.
+    """
+    def __init__(self):
+        self.start_color = curses.start_color
+        self.use_default_colors = curses.use_default_colors
+        self.init_pair = curses.init_pair
+        self.color_pair = curses.color_pair
+        self.doupdate = curses.doupdate
+        self.ungetch = curses.ungetch
+        self.unget_wch = curses.unget_wch
+
+    def write(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
@@ -0,0 +1,156 @@
+import unicodedata
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+
+# columns from one tab stop to the next
+TAB_WIDTH = 4
+# number of lines whose layouts are remembered before the cache is cleared
+LAYOUT_CACHE = 4096
+
+@lru_cache(maxsize = 4096)
+def char_width(char):
+    """Returns the number of columns a character other than a tab takes up on the screen"""
+    category = unicodedata.category(char)
+    if category == 'Cc':
+        return 2
+    if category in ('Mn', 'Me', 'Cf'):
+        # combining marks are drawn over the character before them
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+
+def char_text(char):
+    """Returns what is drawn for a character other than a tab"""
+    if unicodedata.category(char) == 'Cc':
+        # control characters are drawn in caret notation, such as ^M for a carriage return
+        return '^' + chr(ord(char) ^ 64) if ord(char) < 128 else '^?'
+    if unicodedata.category(char) == 'Cs':
+        # a byte that could not be decoded, which can't be drawn on its own
+        return '\ufffd'
+    return char
+
+def is_plain(line):
+    """Checks whether every character of a line takes up exactly one column"""
+    return line.isascii() and line.isprintable()
+
+def measure(line, wrap_width = None):
+    """
+    Returns the column that each character of a line starts at, followed by the width of the line.
+    If lines are wrapped every wrap_width columns, tabs stop at the end of a row and wide
+    characters that do not fit on the rest of a row start the next one.
+    """
+    columns = array('l', [0])
+    column = 0
+    for char in line:
+        if char == '\t':
+            width = TAB_WIDTH - column % TAB_WIDTH
+            if wrap_width is not None:
+                width = min(width, wrap_width - column % wrap_width)
+        else:
+            width = char_width(char)
+            if wrap_width is not None and width > 1 and column % wrap_width + width > wrap_width:
+                # the columns left on the row are drawn as part of the character before
+                column += wrap_width - column % wrap_width
+                columns[-1] = column
+        column += width
+        columns.append(column)
+    return columns
+
+class Layout:
+    """
+    Maps the characters of a line to the columns they are drawn in.
+    Most lines only hold characters that are one column wide, and are not measured at all.
+    Columns past the end of the line are one column per character, like the positions of the caret there.
+    """
+    __slots__ = ('length', 'columns')
+
+    def __init__(self, line, wrap_width = None):
+        self.length = len(line)
+        self.columns = None if is_plain(line) else measure(line, wrap_width)
+
+    def get_width(self):
+        return self.length if self.columns is None else self.columns[-1]
+
+    def get_column(self, x):
+        """Returns the column that character x starts at"""
+        if self.columns is None:
+            return x
+        if x >= self.length:
+            return self.columns[-1] + x - self.length
+        return self.columns[x]
+
+    def get_char_width(self, x):
+        """Returns the number of columns taken up by character x, which is 1 past the end of the line"""
+        return max(1, self.get_column(x + 1) - self.get_column(x))
+
+    def get_index(self, column):
+        """Returns the character drawn in a column"""
+        if self.columns is None:
+            return column
+        if column >= self.columns[-1]:
+            return self.length + column - self.columns[-1]
+        # characters that take up no columns belong to the one before them
+        return max(0, bisect_right(self.columns, column) - 1)
+
+    def get_text(self, line, column1, column2):
+        """Returns what is drawn of a line from column1 to column2 [inclusive, exclusive)"""
+        if self.columns is None:
+            return line[column1 : column2]
+        parts = []
+        x = self.get_index(column1)
+        while x < self.length and self.columns[x] < column2:
+            start, end = self.columns[x], self.columns[x + 1]
+            if line[x] == '\t' or start < column1 or end > column2:
+                # tabs, and characters that are only partly on the screen, are drawn as spaces
+                text, width = '', 0
+            else:
+                text, width = char_text(line[x]), char_width(line[x])
+            start, end = max(start, column1), min(end, column2)
+            parts.append(text + ' ' * (end - start - width))
+            x += 1
+        while x < self.length and self.columns[x] == self.columns[x + 1] == column2:
+            # combining marks of the last character
+            parts.append(char_text(line[x]))
+            x += 1
+        return ''.join(parts)
+
+class LayoutCache:
+    """
+    Remembers the layouts of the lines of a buffer, so that drawing, scrolling and moving
+    the caret don't measure the same lines on every frame.
+    Edits forget the layouts of the changed lines, or of every line after them if lines moved.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.wrap_width = None
+        self.layouts = {}
+
+    def reset(self):
+        self.layouts = {}
+
+    def set_wrap_width(self, wrap_width):
+        """Sets the width that lines are wrapped at, or None if they aren't wrapped"""
+        if wrap_width != self.wrap_width:
+            self.wrap_width = wrap_width
+            self.layouts = {}
+
+    def get(self, y, line = None):
+        """Returns the layout of line y, whose text can be given if it is known"""
+        layout = self.layouts.get(y)
+        if layout is None:
+            if len(self.layouts) >= LAYOUT_CACHE:
+                self.layouts = {}
+            layout = Layout(self.buffer.get_line(y) if line is None else line, self.wrap_width)
+            self.layouts[y] = layout
+        return layout
+
+    def edited(self, y, lines_moved):
+        """Forgets the layouts changed by an edit on line y"""
+        if lines_moved:
+            self.layouts = {line: layout for line, layout in self.layouts.items() if line < y}
+        else:
+            self.layouts.pop(y, None)
+
+    def get_column(self, pos):
+        """Returns the column that the character at a position is drawn in"""
+        return self.get(pos.y).get_column(pos.x)
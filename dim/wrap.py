@@ -0,0 +1,75 @@
+# number of lines whose row counts are remembered before the cache is cleared
+WRAP_CACHE = 4096
+
+class WrapMap:
+    """
+    Maps the lines of a buffer to the screen rows they take up when long lines are wrapped.
+    Row counts come from the widths of lines, and are cached so that scrolling and drawing
+    don't count the rows of the same lines on every frame.
+    Edits forget the counts of the changed lines, or of every line after them if lines moved.
+    A row of the screen is given as (y, r) for the r-th row of line y.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.width = None
+        self.rows = {}
+
+    def set_width(self, width):
+        """Sets the number of characters in a row, forgetting every count if it changed"""
+        width = max(1, width)
+        if width != self.width:
+            self.width = width
+            self.rows = {}
+
+    def get_rows(self, y):
+        rows = self.rows.get(y)
+        if rows is None:
+            if len(self.rows) >= WRAP_CACHE:
+                self.rows = {}
+            # the caret can sit after the last character, so a full row is followed by another
+            rows = self.buffer.layouts.get(y).get_width() // self.width + 1
+            self.rows[y] = rows
+        return rows
+
+    def edited(self, y, lines_moved):
+        """Forgets the counts changed by an edit on line y. Returns whether the rows after line y moved"""
+        if lines_moved:
+            self.rows = {line: rows for line, rows in self.rows.items() if line < y}
+            return True
+        old_rows = self.rows.pop(y, None)
+        return old_rows != self.get_rows(y)
+
+    def get_row(self, pos):
+        """Returns the row that a position is drawn on"""
+        return (pos.y, self.buffer.layouts.get_column(pos) // self.width)
+
+    def next_row(self, row):
+        """Returns the row below, or None at the end of the text"""
+        y, r = row
+        if r + 1 < self.get_rows(y):
+            return (y, r + 1)
+        if y + 1 < self.buffer.get_text_height():
+            return (y + 1, 0)
+        return None
+
+    def prev_row(self, row):
+        """Returns the row above, or None at the start of the text"""
+        y, r = row
+        if r > 0:
+            return (y, r - 1)
+        if y > 0:
+            return (y - 1, self.get_rows(y - 1) - 1)
+        return None
+
+    def scroll(self, top, caret_row, height):
+        """Returns the top row of the screen after scrolling the least amount that shows caret_row"""
+        if caret_row < top:
+            return caret_row
+        # the highest top that still shows the caret is height - 1 rows above it
+        lowest = caret_row
+        for _ in range(height - 1):
+            row = self.prev_row(lowest)
+            if row is None or row <= top:
+                return top
+            lowest = row
+        return max(top, lowest)
@@ -0,0 +1,43 @@
+"""
+Checks that files which are not quite valid in the encoding they are detected as are still opened,
+and saved back byte for byte. Run with python -m pytest tests
+"""
+import codecs
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'dim'))
+
+import pytest
+
+from encoding import detect_encoding, read_text
+from rope import PieceTable
+from save import Saver
+
+INPUTS = [
+    ('utf-8', 'hello\n'.encode('utf-8')),
+    ('invalid utf-8', b'caf\xe9 \xff\xfe\n'),
+    ('utf-16 odd trailing byte', codecs.BOM_UTF16_LE + 'hello\n'.encode('utf-16-le') + b'\x41'),
+    ('utf-16 unpaired high surrogate', codecs.BOM_UTF16_LE + b'a\x00\x00\xd8b\x00\n\x00'),
+    ('utf-16 unpaired low surrogate', codecs.BOM_UTF16_BE + b'\x00a\xdc\x00\x00\n'),
+    ('utf-16 without bom', 'plain ascii text\n'.encode('utf-16-le') + b'\x00\xd8'),
+    ('utf-32 unpaired surrogate', codecs.BOM_UTF32_LE + b'a\x00\x00\x00\x00\xd8\x00\x00'),
+    ('utf-32 invalid code point', codecs.BOM_UTF32_LE + b'a\x00\x00\x00\x00\x00\x11\x00'),
+    ('utf-32 cut short', codecs.BOM_UTF32_LE + b'a\x00\x00\x00b\x00')
+]
+
+@pytest.mark.parametrize('name, data', INPUTS, ids = [name for name, _ in INPUTS])
+def test_round_trip(tmp_path, name, data):
+    path = tmp_path / 'file.txt'
+    path.write_bytes(data)
+    text, encoding = read_text(str(path), detect_encoding(str(path)))
+    saver = Saver(PieceTable.from_text(text), str(path), encoding)
+    saver.wait()
+    assert saver.error is None
+    assert path.read_bytes() == data
+
+def test_unpaired_surrogate_keeps_encoding(tmp_path):
+    path = tmp_path / 'file.txt'
+    path.write_bytes(codecs.BOM_UTF16_LE + b'a\x00\x00\xd8')
+    text, encoding = read_text(str(path), detect_encoding(str(path)))
+    assert (encoding.name, text) == ('utf-16-le', 'a\ud800')